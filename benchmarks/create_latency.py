@@ -0,0 +1,94 @@
+# Copyright 2016, 2019 John J. Rofrano. All Rights Reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+# https://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+### -----------------------------------------------------------
+###  Modified by DevOps Course Summer 2021 Customer Team
+###  Members:
+###     Du, Li | ld2342@nyu.edu | Nanjing | GMT+8
+###     Cai, Shuhong | sc8540@nyu.edu | Shanghai | GMT+8
+###     Zhang, Teng | tz2179@nyu.edu | Ningbo | GMT+8
+###     Zhang, Ken | sz1851@nyu.edu | Shanghai | GMT+8
+###     Wang,Yu-Hsing | yw5629@nyu.edu | Taiwan | GMT+8
+### -----------------------------------------------------------
+
+"""
+Benchmark for creating a single Customer
+
+Posts Customers one at a time to POST /api/customers through the Flask test
+client and reports the per-request latency. The tables of BENCH_DATABASE_URI
+(a scratch SQLite file by default) are dropped first, e.g.:
+  BENCH_DATABASE_URI=sqlite:////tmp/bench.db python -m benchmarks.create_latency -n 500
+"""
+
+import time
+import logging
+import argparse
+import statistics
+from benchmarks import percentile, scratch_database
+
+scratch_database()
+
+# pylint: disable=wrong-import-position
+from sqlalchemy import event
+from service.models import Customer, db
+from service.routes import app
+from tests.factory_test import CustomerFactory, AddressFactory
+
+BASE_URL = "/api/customers"
+
+
+def run(count):
+    """Creates count Customers and returns the latency of each request"""
+    client = app.test_client()
+    latencies = []
+    for index in range(count):
+        body = CustomerFactory().alternative_serialize()
+        body["user_id"] = "bench-{}".format(index)
+        body["address"] = AddressFactory().serialize()
+        del body["address"]["id"]
+        start = time.perf_counter()
+        resp = client.post(BASE_URL, json=body)
+        latencies.append(time.perf_counter() - start)
+        if resp.status_code != 201:
+            raise RuntimeError("Could not create Customer: {}".format(resp.status_code))
+    return latencies
+
+
+def main():
+    """Runs the benchmark and prints a summary"""
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("-n", "--count", type=int, default=500,
+                        help="number of Customers to create")
+    args = parser.parse_args()
+
+    app.logger.setLevel(logging.CRITICAL)
+    Customer.init_db(app)
+    db.drop_all()
+    db.create_all()
+
+    commits = []
+    event.listen(db.engine, "commit", lambda conn: commits.append(1))
+    latencies = run(args.count)
+    db.session.remove()
+    db.drop_all()
+
+    print("{:<14}{}".format("requests:", len(latencies)))
+    print("{:<14}{:.2f}".format("commits/req:", len(commits) / float(len(latencies))))
+    print("{:<14}{:.3f}".format("mean (ms):", statistics.mean(latencies) * 1000))
+    for pct in (50, 95, 99):
+        print("{:<14}{:.3f}".format("p{} (ms):".format(pct), percentile(latencies, pct) * 1000))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,315 @@
+# Copyright 2016, 2019 John J. Rofrano. All Rights Reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+# https://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+### -----------------------------------------------------------
+###  Modified by DevOps Course Summer 2021 Customer Team
+###  Members:
+###     Du, Li | ld2342@nyu.edu | Nanjing | GMT+8
+###     Cai, Shuhong | sc8540@nyu.edu | Shanghai | GMT+8
+###     Zhang, Teng | tz2179@nyu.edu | Ningbo | GMT+8
+###     Zhang, Ken | sz1851@nyu.edu | Shanghai | GMT+8
+###     Wang,Yu-Hsing | yw5629@nyu.edu | Taiwan | GMT+8
+### -----------------------------------------------------------
+
+"""
+Load test of the Customer REST endpoints
+
+Seeds Customers made by CustomerFactory and AddressFactory, then measures the
+throughput and p50/p95/p99 latency of every endpoint: create, get, list
+(unfiltered and with each filter), update, activate, deactivate and delete.
+The toggle scenario activates and deactivates one Customer from
+--concurrency threads at once, to measure the atomic status UPDATE under
+contention. Results are written as JSON so two runs can be compared, e.g.:
+  BENCH_DATABASE_URI=sqlite:////tmp/bench.db python -m benchmarks.load run -o before.json
+  BENCH_DATABASE_URI=sqlite:////tmp/bench.db python -m benchmarks.load run -o after.json
+  python -m benchmarks.load compare before.json after.json
+
+By default requests go through the Flask test client against
+BENCH_DATABASE_URI (a scratch SQLite file unless set), which is emptied
+first. Pass --url to load a running server instead, with --concurrency
+parallel connections.
+"""
+
+import sys
+import json
+import time
+import uuid
+import random
+import logging
+import argparse
+import datetime
+import threading
+import requests
+from concurrent.futures import ThreadPoolExecutor
+from benchmarks import percentile, scratch_database, git_commit
+
+scratch_database()  # LocalClient drops every table, so never the service's database
+
+# pylint: disable=wrong-import-position
+from service.models import Customer, db
+from service.routes import app
+from tests.factory_test import CustomerFactory, AddressFactory
+
+BASE_URL = "/api/customers"
+SEED_BATCH_SIZE = 1000
+# scenarios that always run with --concurrency, even on the in-process client
+CONCURRENT_SCENARIOS = ('toggle',)
+FILTERS = ('first_name', 'last_name', 'active', 'user_id', 'city', 'state', 'zip_code')
+ADDRESS_FILTERS = ('city', 'state', 'zip_code')
+
+
+### -----------------------------------------------------------
+### Clients for the service under test
+### -----------------------------------------------------------
+class LocalClient:
+    """Sends requests through the Flask test client, one client per thread"""
+
+    def __init__(self):
+        app.logger.setLevel(logging.CRITICAL)
+        Customer.init_db(app)
+        db.drop_all()
+        db.create_all()
+        self.target = app.config["DATABASE_URI"].split(":")[0]
+        self.local = threading.local()
+
+    def request(self, method, path, body=None):
+        """Returns the status code and JSON body of a request"""
+        if not hasattr(self.local, "client"):
+            self.local.client = app.test_client()
+        resp = self.local.client.open(path, method=method, json=body)
+        return resp.status_code, resp.get_json(silent=True)
+
+
+class HttpClient:
+    """Sends requests to a running server, one session per thread"""
+
+    def __init__(self, url):
+        self.url = url.rstrip("/")
+        self.target = self.url
+        self.local = threading.local()
+
+    def request(self, method, path, body=None):
+        """Returns the status code and JSON body of a request"""
+        if not hasattr(self.local, "session"):
+            self.local.session = requests.Session()
+        resp = self.local.session.request(method, self.url + path, json=body)
+        try:
+            return resp.status_code, resp.json()
+        except ValueError:
+            return resp.status_code, None
+
+
+### -----------------------------------------------------------
+### Seed data
+### -----------------------------------------------------------
+def fake_customer(user_id, active=True):
+    """Returns the body of a new Customer made by the test factories"""
+    body = CustomerFactory().alternative_serialize()
+    body["user_id"] = user_id
+    body["active"] = active
+    body["address"] = AddressFactory().serialize()
+    del body["address"]["id"]
+    return body
+
+
+def seed(client, count, prefix):
+    """Creates count Customers and returns them as posted, with their IDs"""
+    customers = [fake_customer("{}-{}".format(prefix, index), active=index % 4 != 0)
+                 for index in range(count)]
+    for start in range(0, count, SEED_BATCH_SIZE):
+        batch = customers[start:start + SEED_BATCH_SIZE]
+        code, results = client.request("POST", BASE_URL + "/bulk", batch)
+        if code != 201 or any(result["status"] != 201 for result in results):
+            raise RuntimeError("Could not seed Customers: {}".format(code))
+        for customer, result in zip(batch, results):
+            customer["customer_id"] = result["customer_id"]
+    return customers
+
+
+### -----------------------------------------------------------
+### Scenarios: each returns the requests to send for a run
+### -----------------------------------------------------------
+def scenarios(customers, count, prefix):
+    """Returns the name and (method, path, body, status) requests of every scenario"""
+    pick = random.Random(0)
+    created = [fake_customer("{}-new-{}".format(prefix, index)) for index in range(count)]
+
+    def sample():
+        return [pick.choice(customers) for _ in range(count)]
+
+    def updated(customer):
+        body = dict(customer, first_name=customer["first_name"][::-1])
+        body.pop("customer_id")
+        return body
+
+    def filtered(name, customer):
+        value = customer["address"][name] if name in ADDRESS_FILTERS else customer[name]
+        return "{}?{}={}".format(BASE_URL, name, str(value).lower() if name == "active" else value)
+
+    yield "create", [("POST", BASE_URL, body, 201) for body in created]
+    yield "get", [("GET", "{}/{}".format(BASE_URL, c["customer_id"]), None, 200)
+                  for c in sample()]
+    yield "list", [("GET", BASE_URL, None, 200) for _ in range(count)]
+    for name in FILTERS:
+        yield "list_" + name, [("GET", filtered(name, c), None, 200) for c in sample()]
+    yield "update", [("PUT", "{}/{}".format(BASE_URL, c["customer_id"]), updated(c), 200)
+                     for c in sample()]
+    yield "deactivate", [("PUT", "{}/{}/deactivate".format(BASE_URL, c["customer_id"]), None, 200)
+                         for c in sample()]
+    yield "activate", [("PUT", "{}/{}/activate".format(BASE_URL, c["customer_id"]), None, 200)
+                       for c in sample()]
+    # one Customer activated and deactivated from every connection at once
+    toggled = customers[0]["customer_id"]
+    yield "toggle", [("PUT", "{}/{}/{}".format(BASE_URL, toggled,
+                                              "activate" if index % 2 else "deactivate"), None, 200)
+                     for index in range(count)]
+    yield "delete", [("DELETE", "{}/{}".format(BASE_URL, c["customer_id"]), None, 204)
+                     for c in created if "customer_id" in c]
+
+
+def measure(client, planned, concurrency):
+    """Sends the requests and returns the scenario's statistics"""
+    def send(request):
+        method, path, body, expected = request
+        start = time.perf_counter()
+        code, result = client.request(method, path, body)
+        elapsed = time.perf_counter() - start
+        if method == "POST" and code == 201:
+            body["customer_id"] = result["customer_id"]
+        return elapsed, code == expected
+
+    start = time.perf_counter()
+    with ThreadPoolExecutor(concurrency) as executor:
+        samples = list(executor.map(send, planned))
+    duration = time.perf_counter() - start
+    latencies = [elapsed for elapsed, _ in samples]
+    return {
+        "concurrency": concurrency,
+        "requests": len(samples),
+        "errors": sum(1 for _, ok in samples if not ok),
+        "throughput": len(samples) / duration if duration else 0.0,
+        "mean_ms": sum(latencies) / len(latencies) * 1000,
+        "p50_ms": percentile(latencies, 50) * 1000,
+        "p95_ms": percentile(latencies, 95) * 1000,
+        "p99_ms": percentile(latencies, 99) * 1000,
+    }
+
+
+def run(args):
+    """Seeds the database, runs every scenario and writes the results"""
+    client = HttpClient(args.url) if args.url else LocalClient()
+    concurrency = args.concurrency if args.url else 1
+    prefix = "load-" + uuid.uuid4().hex[:8]
+    customers = seed(client, args.customers, prefix)
+
+    results = {}
+    for name, planned in scenarios(customers, args.requests, prefix):
+        if not planned or (args.only and name not in args.only):
+            continue
+        results[name] = measure(client, planned, args.concurrency
+                                if name in CONCURRENT_SCENARIOS else concurrency)
+        print("{:<18}{:>9.1f} req/s  p50 {:>8.2f}  p95 {:>8.2f}  p99 {:>8.2f} ms  errors {}"
+              .format(name, results[name]["throughput"], results[name]["p50_ms"],
+                      results[name]["p95_ms"], results[name]["p99_ms"],
+                      results[name]["errors"]))
+
+    if args.url:
+        for customer in customers:
+            client.request("DELETE", "{}/{}".format(BASE_URL, customer["customer_id"]))
+
+    report = {
+        "commit": git_commit(),
+        "date": datetime.datetime.utcnow().isoformat() + "Z",
+        "target": client.target,
+        "customers": args.customers,
+        "requests": args.requests,
+        "concurrency": concurrency,
+        "scenarios": results,
+    }
+    with open(args.output, "w") as output:
+        json.dump(report, output, indent=2, sort_keys=True)
+    print("Results written to {}".format(args.output))
+
+
+def compare(args):
+    """Prints the change between two result files; fails on regressions and unmatched scenarios"""
+    with open(args.baseline) as baseline, open(args.current) as current:
+        before = json.load(baseline)["scenarios"]
+        after = json.load(current)["scenarios"]
+
+    regressions = []
+    unmatched = []
+    print("{:<18}{:>12}{:>12}{:>10}{:>12}{:>12}{:>10}".format(
+        "scenario", "req/s was", "req/s now", "change", "p95 was", "p95 now", "change"))
+    for name in sorted(set(before) | set(after)):
+        if name not in after or name not in before:
+            print("{:<18}  only in the {} run".format(name, "earlier" if name in before
+                                                      else "later"))
+            unmatched.append(name)
+            continue
+        old, new = before[name], after[name]
+        throughput = (new["throughput"] / old["throughput"] - 1) * 100
+        latency = (new["p95_ms"] / old["p95_ms"] - 1) * 100
+        flag = ""
+        if throughput < -args.threshold or latency > args.threshold:
+            regressions.append(name)
+            flag = "  REGRESSION"
+        print("{:<18}{:>12.1f}{:>12.1f}{:>9.1f}%{:>12.2f}{:>12.2f}{:>9.1f}%{}".format(
+            name, old["throughput"], new["throughput"], throughput,
+            old["p95_ms"], new["p95_ms"], latency, flag))
+    if unmatched:
+        print("{} scenario(s) ran only once; run both with the same scenarios"
+              .format(len(unmatched)))
+    if regressions:
+        print("{} scenario(s) regressed by more than {}%".format(len(regressions),
+                                                                args.threshold))
+    if unmatched or regressions:
+        return 1
+    return 0
+
+
+def main():
+    """Parses the command line and runs or compares load tests"""
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    commands = parser.add_subparsers(dest="command")
+    commands.required = True
+
+    run_parser = commands.add_parser("run", help="run the load test")
+    run_parser.add_argument("-c", "--customers", type=int, default=1000,
+                            help="number of Customers to seed")
+    run_parser.add_argument("-n", "--requests", type=int, default=200,
+                            help="number of requests per scenario")
+    run_parser.add_argument("-o", "--output", default="load-results.json",
+                            help="file to write the JSON results to")
+    run_parser.add_argument("--url", help="base URL of a running server to load instead")
+    run_parser.add_argument("--concurrency", type=int, default=8,
+                            help="parallel connections when loading --url, and for "
+                                 "the toggle scenario")
+    run_parser.add_argument("--only", nargs="+", help="run only these scenarios")
+
+    compare_parser = commands.add_parser("compare", help="compare two result files")
+    compare_parser.add_argument("baseline", help="results of the earlier run")
+    compare_parser.add_argument("current", help="results of the later run")
+    compare_parser.add_argument("-t", "--threshold", type=float, default=10.0,
+                                help="percent change in req/s or p95 that is a regression")
+
+    args = parser.parse_args()
+    if args.command == "run":
+        run(args)
+        return 0
+    return compare(args)
+
+
+if __name__ == "__main__":
+    sys.exit(main())
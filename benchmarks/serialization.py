@@ -0,0 +1,238 @@
+# Copyright 2016, 2019 John J. Rofrano. All Rights Reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+# https://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+### -----------------------------------------------------------
+###  Modified by DevOps Course Summer 2021 Customer Team
+###  Members:
+###     Du, Li | ld2342@nyu.edu | Nanjing | GMT+8
+###     Cai, Shuhong | sc8540@nyu.edu | Shanghai | GMT+8
+###     Zhang, Teng | tz2179@nyu.edu | Ningbo | GMT+8
+###     Zhang, Ken | sz1851@nyu.edu | Shanghai | GMT+8
+###     Wang,Yu-Hsing | yw5629@nyu.edu | Taiwan | GMT+8
+### -----------------------------------------------------------
+
+"""
+Microbenchmarks of Customer serialization
+
+Times Customer.serialize, Customer.deserialize, Address.serialize and the
+flask-restx marshalling of customer_model on 1, 1k and 100k Customers read
+from SQLite, and reports the cost per object in microseconds. The list.*
+cases time a whole list body, from the query to the JSON bytes. A baseline is
+kept in benchmarks/baselines/serialization.json:
+  python -m benchmarks.serialization run -o current.json
+  python -m benchmarks.serialization compare current.json
+
+The baseline is only written from a clean checkout, so it records the commit
+it measures, and on the Python of runtime.txt, which the service runs on.
+"""
+
+import os
+import sys
+import json
+import timeit
+import logging
+import argparse
+import datetime
+
+from benchmarks import scratch_database, git_commit
+
+# These benchmarks always run on a scratch database, SQLite unless set
+scratch_database("sqlite:////tmp/serialization.db")
+
+# pylint: disable=wrong-import-position
+import orjson
+from flask_restx import marshal
+from service.models import Customer, db
+from service.routes import app, customer_model, serialize_row, row_layout
+from tests.factory_test import CustomerFactory, AddressFactory
+
+SIZES = (1, 1000, 100000)
+BASELINE = os.path.join(os.path.dirname(__file__), "baselines", "serialization.json")
+RUNTIME = os.path.join(os.path.dirname(os.path.dirname(__file__)), "runtime.txt")
+SEED_BATCH_SIZE = 1000
+MIN_OBJECTS_TIMED = 10000  # small sizes are repeated to time at least this many objects
+
+
+def seed(count):
+    """Creates count Customers with Addresses and returns them loaded from the database"""
+    db.drop_all()
+    db.create_all()
+    for start in range(0, count, SEED_BATCH_SIZE):
+        customers = []
+        for index in range(start, min(count, start + SEED_BATCH_SIZE)):
+            customer = CustomerFactory()
+            customer.user_id = "serialize-{}".format(index)
+            customers.append((customer, AddressFactory()))
+        Customer.bulk_create(customers)
+    db.session.expunge_all()
+    return Customer.query.order_by(Customer.customer_id).all()
+
+
+def cases(customers):
+    """Returns the name and a callable of every benchmark for a list of Customers"""
+    payloads = [customer.alternative_serialize() for customer in customers]
+    serialized = [customer.serialize() for customer in customers]
+    yield "customer.serialize", lambda: [c.serialize() for c in customers]
+    yield "customer.deserialize", lambda: [Customer().deserialize(p) for p in payloads]
+    yield "address.serialize", lambda: [c.address.serialize() for c in customers]
+    yield "marshal.customer_model", lambda: marshal(serialized, customer_model)
+    yield "list.orm_marshal_json", lambda: list_orm(len(customers))
+    yield "list.rows_orjson", lambda: list_rows(len(customers))
+    yield "list.sparse_orjson", lambda: list_sparse(len(customers))
+
+
+def list_orm(limit):
+    """Lists Customers the way GET /customers did before the row serializer"""
+    db.session.expunge_all()
+    customers = Customer.query.order_by(Customer.customer_id).limit(limit + 1).all()[:limit]
+    return json.dumps(marshal([c.serialize() for c in customers], customer_model))
+
+
+def list_rows(limit):
+    """Lists Customers the way GET /customers does"""
+    rows, _ = Customer.search_rows(limit=limit)
+    return orjson.dumps([serialize_row(row) for row in rows])
+
+
+def list_sparse(limit):
+    """Lists Customers the way GET /customers?fields=customer_id,user_id does"""
+    layout = row_layout(("customer_id", "user_id"))
+    rows, _ = Customer.search_rows(limit=limit, customer_columns=layout.customer_columns,
+                                   address_columns=layout.address_columns)
+    return orjson.dumps([layout.serialize(row) for row in rows])
+
+
+def python_version():
+    """Returns the major.minor version of this Python"""
+    return "{}.{}".format(*sys.version_info[:2])
+
+
+def target_python():
+    """Returns the major.minor Python version in runtime.txt, e.g. 3.8"""
+    with open(RUNTIME) as runtime:
+        version = runtime.read().strip()  # python-3.8.x
+    return ".".join(version.split("-")[-1].split(".")[:2])
+
+
+def run(args):
+    """Times every case at every size and writes the results"""
+    commit = git_commit()
+    if os.path.abspath(args.output) == os.path.abspath(BASELINE):
+        if commit is None or commit.endswith("-dirty"):
+            sys.exit("Refusing to write the baseline from uncommitted changes; "
+                     "commit them first so it records the commit it measures")
+        if python_version() != target_python():
+            sys.exit("Refusing to write the baseline on Python {}; runtime.txt deploys "
+                     "Python {}".format(python_version(), target_python()))
+    app.logger.setLevel(logging.CRITICAL)
+    Customer.init_db(app)
+    everyone = seed(max(args.sizes))
+
+    results = {}
+    for size in args.sizes:
+        customers = everyone[:size]
+        number = max(1, MIN_OBJECTS_TIMED // size)
+        for name, case in cases(customers):
+            best = min(timeit.repeat(case, number=number, repeat=args.repeat))
+            per_object = best / number / size * 1e6
+            results.setdefault(name, {})[str(size)] = per_object
+            print("{:<24}{:>8} objects {:>10.3f} us/object".format(name, size, per_object))
+    db.session.remove()
+    db.drop_all()
+
+    report = {
+        "commit": commit,
+        "date": datetime.datetime.utcnow().isoformat() + "Z",
+        "python": sys.version.split()[0],
+        "results": results,
+    }
+    with open(args.output, "w") as output:
+        json.dump(report, output, indent=2, sort_keys=True)
+    print("Results written to {}".format(args.output))
+
+
+def compare(args):
+    """Prints the change against the baseline; fails on regressions and unmatched cases"""
+    with open(args.baseline) as baseline, open(args.current) as current:
+        before = json.load(baseline)
+        after = json.load(current)
+    if before["python"].split(".")[:2] != after["python"].split(".")[:2]:
+        print("Cannot compare a run on Python {} with a baseline from Python {}"
+              .format(after["python"], before["python"]))
+        return 1
+    print("Baseline of commit {} on Python {}".format(before["commit"], before["python"]))
+    before, after = before["results"], after["results"]
+
+    regressions = []
+    unmeasured = []
+    print("{:<24}{:>8}{:>12}{:>12}{:>10}".format("case", "objects", "us before", "us now",
+                                                  "change"))
+    for name in sorted(set(before) | set(after)):
+        if name not in after:
+            print("{:<24}{:>8}  missing from this run".format(name, ""))
+            unmeasured.append(name)
+            continue
+        for size in sorted(after[name], key=int):
+            if size not in before.get(name, {}):
+                print("{:<24}{:>8}  not in the baseline".format(name, size))
+                unmeasured.append((name, size))
+                continue
+            old, new = before[name][size], after[name][size]
+            change = (new / old - 1) * 100
+            flag = ""
+            if change > args.threshold:
+                regressions.append((name, size))
+                flag = "  REGRESSION"
+            print("{:<24}{:>8}{:>12.3f}{:>12.3f}{:>9.1f}%{}".format(name, size, old, new,
+                                                                     change, flag))
+    if unmeasured:
+        print("{} case(s) cannot be compared; refresh the baseline when cases change"
+              .format(len(unmeasured)))
+    if regressions:
+        print("{} case(s) slowed down by more than {}%".format(len(regressions), args.threshold))
+    if unmeasured or regressions:
+        return 1
+    return 0
+
+
+def main():
+    """Parses the command line and runs or compares the microbenchmarks"""
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    commands = parser.add_subparsers(dest="command")
+    commands.required = True
+
+    run_parser = commands.add_parser("run", help="run the microbenchmarks")
+    run_parser.add_argument("-s", "--sizes", type=int, nargs="+", default=list(SIZES),
+                            help="numbers of Customers to serialize")
+    run_parser.add_argument("-r", "--repeat", type=int, default=5,
+                            help="timings per case; the fastest one is kept")
+    run_parser.add_argument("-o", "--output", default="serialization-results.json",
+                            help="file to write the JSON results to")
+
+    compare_parser = commands.add_parser("compare", help="compare results with the baseline")
+    compare_parser.add_argument("current", help="results of the new run")
+    compare_parser.add_argument("-b", "--baseline", default=BASELINE,
+                                help="results to compare against")
+    compare_parser.add_argument("-t", "--threshold", type=float, default=20.0,
+                                help="percent slowdown per object that is a regression")
+
+    args = parser.parse_args()
+    if args.command == "run":
+        run(args)
+        return 0
+    return compare(args)
+
+
+if __name__ == "__main__":
+    sys.exit(main())
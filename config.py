@@ -12,11 +12,50 @@ if 'VCAP_SERVICES' in os.environ:
     VCAP_SERVICES = json.loads(os.environ['VCAP_SERVICES'])
     DATABASE_URI = VCAP_SERVICES['user-provided'][0]['credentials']['url']
 
+# Optional comma separated read replicas for the read-only endpoints
+DATABASE_REPLICA_URIS = [
+    uri.strip() for uri in os.getenv("DATABASE_REPLICA_URIS", "").split(",") if uri.strip()
+]
 
 # Configure SQLAlchemy
 SQLALCHEMY_DATABASE_URI = DATABASE_URI
 SQLALCHEMY_TRACK_MODIFICATIONS = False
 
+# Database connection pool per worker (sizes are ignored by SQLite)
+DB_POOL_SIZE = int(os.getenv("DB_POOL_SIZE", "5"))
+DB_MAX_OVERFLOW = int(os.getenv("DB_MAX_OVERFLOW", "10"))
+DB_POOL_TIMEOUT = int(os.getenv("DB_POOL_TIMEOUT", "30"))
+DB_POOL_RECYCLE = int(os.getenv("DB_POOL_RECYCLE", "1800"))
+DB_POOL_PRE_PING = os.getenv("DB_POOL_PRE_PING", "true").lower() in ("true", "yes", "1")
+
+# Statements slower than this many seconds are logged with their route
+DB_SLOW_QUERY_SECONDS = float(os.getenv("DB_SLOW_QUERY_SECONDS", "0.5"))
+
+# Cache of serialized Customers, shared by every worker and instance through
+# the Redis server at REDIS_URL or the one bound in VCAP_SERVICES. Without a
+# Redis server caching is off ("none"): a per-process cache would serve stale
+# Customers after another process wrote them. "local" forces a per-process
+# LRU cache (single process only) and "fakeredis" is an in-memory Redis.
+REDIS_URL = os.getenv("REDIS_URL")
+if REDIS_URL is None and 'VCAP_SERVICES' in os.environ:
+    for service in [service for services in json.loads(os.environ['VCAP_SERVICES']).values()
+                    for service in services]:
+        credentials = service.get('credentials', {})
+        uri = credentials.get('uri') or credentials.get('url') or ''
+        if uri.startswith(('redis://', 'rediss://')):
+            print('Getting cache from VCAP_SERVICES')
+            REDIS_URL = uri
+            break
+CACHE_BACKEND = os.getenv("CACHE_BACKEND", "redis" if REDIS_URL else "none")
+CACHE_URI = os.getenv("CACHE_URI", REDIS_URL or "redis://localhost:6379/0")
+CACHE_MAXSIZE = int(os.getenv("CACHE_MAXSIZE", "10000"))
+CACHE_TTL = int(os.getenv("CACHE_TTL", "60"))
+
+# Requests sent with the PROFILE_HEADER header (e.g. "X-Profile: 1") are run
+# under cProfile and saved to PROFILE_DIR; unset PROFILE_DIR disables it
+PROFILE_DIR = os.getenv("PROFILE_DIR")
+PROFILE_HEADER = os.getenv("PROFILE_HEADER", "X-Profile")
+
 # Secret for session management
 SECRET_KEY = os.getenv("SECRET_KEY", "sup3r-s3cr3t")
 LOGGING_LEVEL = logging.INFO
@@ -1,6 +1,81 @@
+"""
+Gunicorn configuration for the Customer Service
+
+The concurrency model is taken from the environment:
+
+  WEB_CONCURRENCY      worker processes (default: one per CPU)
+  GUNICORN_THREADS     threads per worker (default: 1); more than one uses
+                       gthread workers
+  GUNICORN_PRELOAD     import the app once in the master before forking
+  GUNICORN_MAX_REQUESTS / GUNICORN_MAX_REQUESTS_JITTER
+                       restart a worker after this many requests (+ jitter)
+  PROMETHEUS_MULTIPROC_DIR
+                       where workers keep their metrics (default: a new temp dir)
+"""
 import os
+import sys
+import glob
+import shutil
+import tempfile
+import multiprocessing
+from config import CACHE_BACKEND
 
 PORT = os.getenv("PORT", "5000")
-BIND = "0.0.0.0:" + PORT
-WORKERS = 1
-LOG_LEVEL = "info"
+
+bind = "0.0.0.0:" + PORT
+workers = int(os.getenv("WEB_CONCURRENCY", str(multiprocessing.cpu_count())))
+threads = int(os.getenv("GUNICORN_THREADS", "1"))
+worker_class = "gthread" if threads > 1 else "sync"
+preload_app = os.getenv("GUNICORN_PRELOAD", "true").lower() in ("true", "yes", "1")
+max_requests = int(os.getenv("GUNICORN_MAX_REQUESTS", "1000"))
+max_requests_jitter = int(os.getenv("GUNICORN_MAX_REQUESTS_JITTER", "100"))
+loglevel = os.getenv("LOG_LEVEL", "info")
+
+# Every worker would keep its own copy of a per-process cache and serve the
+# Customers other workers changed, so refuse to start
+if workers > 1 and CACHE_BACKEND in ("local", "fakeredis"):
+    sys.exit("{} workers would each keep their own {} customer cache; "
+             "set CACHE_BACKEND=redis or WEB_CONCURRENCY=1".format(workers, CACHE_BACKEND))
+
+# Workers write their Prometheus samples here so /metrics can add them up;
+# it must be set before the app (and prometheus_client) is imported
+METRICS_DIR = None  # the directory made here, removed again on exit
+if "PROMETHEUS_MULTIPROC_DIR" not in os.environ:
+    METRICS_DIR = tempfile.mkdtemp(prefix="customer-metrics-")
+    os.environ["PROMETHEUS_MULTIPROC_DIR"] = METRICS_DIR
+
+
+def dispose_engines():
+    """Drops the database connections of this process if the app is loaded"""
+    models = sys.modules.get("service.models")
+    if models is not None:
+        models.db.engine.dispose()
+        models.replicas.dispose()
+
+
+def on_starting(server):  # pylint: disable=unused-argument
+    """Drops the Prometheus samples left behind by an earlier run"""
+    for path in glob.glob(os.path.join(os.environ["PROMETHEUS_MULTIPROC_DIR"], "*.db")):
+        os.remove(path)
+
+
+def when_ready(server):  # pylint: disable=unused-argument
+    """Closes the connections the master opened while preloading the app"""
+    dispose_engines()
+
+
+def post_fork(server, worker):  # pylint: disable=unused-argument
+    """Gives every worker its own connection pools instead of the master's"""
+    dispose_engines()
+
+
+def child_exit(server, worker):  # pylint: disable=unused-argument
+    """Stops reporting the live gauges of a worker that exited"""
+    from prometheus_client import multiprocess  # pylint: disable=import-outside-toplevel
+    multiprocess.mark_process_dead(worker.pid)
+
+
+def on_exit(server):  # pylint: disable=unused-argument
+    """Removes the metrics directory made for this run"""
+    if METRICS_DIR is not None:
+        shutil.rmtree(METRICS_DIR, ignore_errors=True)
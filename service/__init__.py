@@ -39,7 +39,7 @@ app = Flask(__name__)
 app.config.from_object("config")
 
 # Import the routes After the Flask app is created
-from service import routes, models # pylint: disable=wrong-import-position
+from service import routes, models, metrics, profiling # pylint: disable=wrong-import-position
 
 # Set up logging for production
 print("Setting up logging for {}...".format(__name__))
@@ -71,6 +71,13 @@ app.logger.info("  Zhang, Ken S. | sz1851@nyu.edu  ".center(70, "*"))
 app.logger.info("  Wang, Yu-Hsing | yw5629@nyu.edu  ".center(70, "*"))
 app.logger.info(70 * "*")
 
+# Profile the requests that ask for it, only when a profile directory is set
+if app.config["PROFILE_DIR"]:
+    app.wsgi_app = profiling.ProfilerMiddleware(app.wsgi_app, app.config["PROFILE_DIR"],
+                                                app.config["PROFILE_HEADER"])
+    app.logger.info("Profiling requests with %s to %s",
+                    app.config["PROFILE_HEADER"], app.config["PROFILE_DIR"])
+
 try:
     models.init_db(app)  # make our sqlalchemy tables
 except Exception as error: # pylint: disable=broad-except
@@ -79,4 +86,11 @@ except Exception as error: # pylint: disable=broad-except
     sys.exit(4)
 
 app.logger.info("Service inititalized!")
+
+
+@app.cli.command("upgrade-db")
+def upgrade_db():
+    """Adds the columns and indexes missing from tables created by older versions"""
+    models.upgrade_tables()
+    app.logger.info("Database upgraded")
     
\ No newline at end of file
@@ -0,0 +1,264 @@
+# Copyright 2016, 2021 John J. Rofrano. All Rights Reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+# https://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+### -----------------------------------------------------------
+###  Modified by DevOps Course Summer 2021 Customer Team
+###  Members:
+###     Du, Li | ld2342@nyu.edu | Nanjing | GMT+8
+###     Cai, Shuhong | sc8540@nyu.edu | Shanghai | GMT+8
+###     Zhang, Teng | tz2179@nyu.edu | Ningbo | GMT+8
+###     Zhang, Ken | sz1851@nyu.edu | Shanghai | GMT+8
+###     Wang,Yu-Hsing | yw5629@nyu.edu | Taiwan | GMT+8
+### -----------------------------------------------------------
+
+"""
+Async Customer Service
+
+Serves the Customer API under an ASGI server. The hot routes run on async
+database access (asyncpg for PostgreSQL, aiosqlite for SQLite), so one
+process can keep many of them in flight while they wait on the database:
+
+  uvicorn service.asgi:app --host 0.0.0.0 --port 8000
+
+Async Paths:
+------
+GET /api/customers - Return a list of Customers (filters, ids, fields and paging)
+GET /api/customers/{id} - Return the Customer with a given ID number
+PUT /api/customers/{id}/activate - Activate a Customer
+PUT /api/customers/{id}/deactivate - Deactivate a Customer
+
+Every other request is passed on to the Flask service, which runs in a
+thread pool. Both build their SQL with the same Customer helpers and
+serialize rows with the same functions, so they return the same bodies and
+ETags.
+"""
+
+import orjson
+from databases import Database, DatabaseURL
+from starlette.applications import Starlette
+from starlette.concurrency import run_in_threadpool
+from starlette.exceptions import HTTPException
+from starlette.middleware.wsgi import WSGIMiddleware
+from starlette.responses import JSONResponse, Response
+from starlette.routing import Mount, Route
+from flask_restx import inputs, marshal
+from werkzeug.http import parse_etags, quote_etag
+from service.models import Customer, DataValidationError
+from service.routes import customer_model, customer_cache, make_etag, encode_cursor, \
+    decode_cursor, search_filters, parse_fields, parse_ids, unique_ids, order_rows, \
+    row_layout, fieldset_tag, serialize_row, row_version_tag, MAX_PAGE_SIZE
+from . import status  # HTTP Status Codes
+
+# Import Flask application for its configuration, logger and the routes
+# that are not served here; importing it also creates the tables
+from . import app as flask_app
+
+logger = flask_app.logger
+
+### -----------------------------------------------------------
+### Async database shared by every request of this process
+### -----------------------------------------------------------
+def async_database(uri):
+    """
+    Returns an async Database for a SQLAlchemy database URI
+
+    The driver is chosen from the scheme: postgres(ql) uses asyncpg and
+    sqlite uses aiosqlite. A "host" query parameter (a unix socket
+    directory, as libpq accepts it) is passed on to asyncpg.
+    """
+    url = DatabaseURL(uri)
+    scheme = url.scheme.split("+")[0]
+    if scheme == "postgres":
+        scheme = "postgresql"
+    url = url.replace(scheme=scheme)
+    options = {}
+    if scheme == "postgresql" and "host" in url.options:
+        options["host"] = url.options["host"]
+        url = DatabaseURL(str(url).split("?")[0])
+    return Database(url, **options)
+
+database = async_database(flask_app.config["DATABASE_URI"])
+
+def json_response(body, headers=None):
+    """ Returns a JSON response encoded like the Flask service does """
+    return Response(orjson.dumps(body), headers=headers, media_type='application/json')
+
+def not_modified(request, etag):
+    """ Returns True if the request already holds this version (If-None-Match) """
+    return parse_etags(request.headers.get('if-none-match')).contains_weak(etag)
+
+def not_found(customer_id):
+    """ Returns the error for a Customer that does not exist """
+    return HTTPException(status.HTTP_404_NOT_FOUND,
+                         "Customer with id '{}' was not found.".format(customer_id))
+
+### -----------------------------------------------------------
+### Special Error Handlers
+### -----------------------------------------------------------
+async def request_validation_error(request, error):
+    """ Handles Value Errors from bad data """
+    message = str(error)
+    logger.warning(message)
+    return JSONResponse({
+        'status_code': status.HTTP_400_BAD_REQUEST,
+        'error': 'Bad Request',
+        'message': message
+    }, status_code=status.HTTP_400_BAD_REQUEST)
+
+async def http_error(request, error):
+    """ Handles aborted requests """
+    logger.error(error.detail)
+    return JSONResponse({'message': error.detail}, status_code=error.status_code)
+
+######################################################################
+# PATH /api/customers
+######################################################################
+async def list_customers(request):
+    """
+    Return all of the Customers that satisfy query constraints
+    """
+    logger.info("Request for customer list")
+    args = request.query_params
+    filters = search_filters(args)
+    requested = parse_fields(args.get('fields'))
+    layout = row_layout(requested)
+    if args.get('ids') is not None:
+        if args.get('limit') or args.get('cursor'):
+            raise DataValidationError("ids cannot be combined with limit or cursor")
+        customer_ids = unique_ids(parse_ids(args['ids']))
+        logger.info("Fetching %d customers filtered by %s", len(customer_ids), filters)
+        rows = []
+        if customer_ids:
+            rows = await database.fetch_all(Customer.search_select(
+                customer_ids=customer_ids, customer_columns=layout.customer_columns,
+                address_columns=layout.address_columns, **filters))
+        rows, etag, headers = order_rows(rows, customer_ids, requested)
+        return rows_response(request, rows, etag, headers, layout.serialize)
+
+    logger.info('Filtering by %s', filters)
+    after = decode_cursor(args['cursor']) if args.get('cursor') else None
+    limit = None
+    if args.get('limit'):
+        try:
+            limit = inputs.int_range(1, MAX_PAGE_SIZE)(args['limit'])
+        except ValueError as error:
+            raise DataValidationError(str(error))
+    rows = await database.fetch_all(Customer.search_select(
+        after, limit, customer_columns=layout.customer_columns,
+        address_columns=layout.address_columns, **filters))
+    has_more = limit is not None and len(rows) > limit
+    rows = rows[:limit]
+    etag = make_etag(*fieldset_tag(requested), has_more,
+                     *[layout.version_tag(row) for row in rows])
+    headers = {'ETag': quote_etag(etag)}
+    if has_more:
+        cursor = encode_cursor(rows[-1][0])
+        next_url = request.url.include_query_params(cursor=cursor)
+        headers['Link'] = '<{}>; rel="next"'.format(next_url)
+        headers['X-Next-Cursor'] = cursor
+    return rows_response(request, rows, etag, headers, layout.serialize)
+
+def rows_response(request, rows, etag, headers, serialize):
+    """ Returns the rows as a JSON list, or 304 if the client already has them """
+    if not_modified(request, etag):
+        logger.info("Customer list not modified")
+        return Response(status_code=status.HTTP_304_NOT_MODIFIED, headers=headers)
+    logger.info("Returning %d customers", len(rows))
+    return json_response([serialize(row) for row in rows], headers)
+
+######################################################################
+# PATH /api/customers/{customer_id}
+######################################################################
+async def get_customer(request):
+    """
+    Retrieve a Customer
+    This endpoint will return a Customer based on its Customer ID
+    """
+    customer_id = request.path_params['customer_id']
+    logger.info("Request for customer with id: %s", customer_id)
+    # the cache client blocks, so it runs outside of the event loop
+    entry = await run_in_threadpool(customer_cache.get, customer_id)
+    if entry is None:
+        generation = await run_in_threadpool(customer_cache.generation, customer_id)
+        row = await database.fetch_one(Customer.search_select(customer_ids=[customer_id]))
+        if row is None:
+            raise not_found(customer_id)
+        entry = {'etag': make_etag(row_version_tag(row)), 'customer': serialize_row(row)}
+        await run_in_threadpool(customer_cache.fill, customer_id, entry, generation)
+    headers = {'ETag': quote_etag(entry['etag'])}
+    if not_modified(request, entry['etag']):
+        logger.info("Customer %s not modified", customer_id)
+        return Response(status_code=status.HTTP_304_NOT_MODIFIED, headers=headers)
+    logger.info("Returning customer: %s", customer_id)
+    return json_response(marshal(entry['customer'], customer_model), headers)
+
+######################################################################
+# PATH /api/customers/{customer_id}/activate and /deactivate
+######################################################################
+async def set_active(customer_id, active):
+    """ Sets the active status of a Customer like Customer.set_active does """
+    logger.info("Setting active status of customer %s to %s", customer_id, active)
+    *updates, select = Customer.set_active_statements(customer_id, active,
+                                                          database.url.dialect)
+    async with database.transaction():
+        for update in updates:
+            await database.execute(update)
+        row = await database.fetch_one(select)
+    if row is None:
+        raise not_found(customer_id)
+    await run_in_threadpool(customer_cache.delete, customer_id)
+    return json_response(serialize_row(row), {'ETag': quote_etag(make_etag(row_version_tag(row)))})
+
+async def activate_customer(request):
+    """
+    Activate a Customer
+    This endpoint will return a Customer based on its Customer ID
+    """
+    customer_id = request.path_params['customer_id']
+    logger.info("Request to activate customer with id: %s", customer_id)
+    response = await set_active(customer_id, True)
+    logger.info("Customer with ID [%s] activated.", customer_id)
+    return response
+
+async def deactivate_customer(request):
+    """
+    Deactivate a Customer
+    This endpoint will return a Customer based on its Customer ID
+    """
+    customer_id = request.path_params['customer_id']
+    logger.info("Request to deactivate customer with id: %s", customer_id)
+    response = await set_active(customer_id, False)
+    logger.info("Customer with ID [%s] deactivated.", customer_id)
+    return response
+
+### -----------------------------------------------------------
+### ASGI application
+### -----------------------------------------------------------
+app = Starlette(
+    routes=[
+        Route('/api/customers', list_customers, methods=['GET']),
+        Route('/api/customers/{customer_id:int}', get_customer, methods=['GET']),
+        Route('/api/customers/{customer_id:int}/activate', activate_customer, methods=['PUT']),
+        Route('/api/customers/{customer_id:int}/deactivate', deactivate_customer,
+              methods=['PUT']),
+        # everything else, other methods on the paths above included
+        Mount('', app=WSGIMiddleware(flask_app)),
+    ],
+    exception_handlers={
+        DataValidationError: request_validation_error,
+        HTTPException: http_error,
+    },
+    on_startup=[database.connect],
+    on_shutdown=[database.disconnect],
+)
@@ -0,0 +1,370 @@
+# Copyright 2016, 2019 John J. Rofrano. All Rights Reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+# https://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+### -----------------------------------------------------------
+###  Modified by DevOps Course Summer 2021 Customer Team
+###  Members:
+###     Du, Li | ld2342@nyu.edu | Nanjing | GMT+8
+###     Cai, Shuhong | sc8540@nyu.edu | Shanghai | GMT+8
+###     Zhang, Teng | tz2179@nyu.edu | Ningbo | GMT+8
+###     Zhang, Ken | sz1851@nyu.edu | Shanghai | GMT+8
+###     Wang,Yu-Hsing | yw5629@nyu.edu | Taiwan | GMT+8
+### -----------------------------------------------------------
+
+"""
+Caches for serialized Customer documents
+
+Cache - the interface shared by every cache backend
+LRUCache - a bounded in-process cache whose entries also expire after a TTL
+RedisCache - a cache shared by every worker, kept in a Redis-protocol server
+"""
+
+import json
+import time
+import logging
+import threading
+from collections import OrderedDict
+import redis
+from redis.exceptions import RedisError, WatchError
+
+logger = logging.getLogger("flask.app")
+
+
+def create_cache(backend="local", maxsize=1024, ttl=60, uri=None):
+    """Returns the cache backend configured by name
+
+    :param backend: "redis" for a RedisCache connected to uri, "none" to
+        cache nothing, "local" for an in-process LRUCache, or "fakeredis"
+        for a RedisCache kept in memory (a stand-in for tests and local
+        development)
+    :type backend: str
+
+    :return: the cache
+    :rtype: Cache
+
+    """
+    logger.info("Using the %s cache backend", backend)
+    if backend == "redis":
+        return RedisCache(redis.Redis.from_url(uri), ttl)
+    if backend == "fakeredis":
+        import fakeredis  # pylint: disable=import-outside-toplevel
+        return RedisCache(fakeredis.FakeRedis(), ttl)
+    if backend == "local":
+        return LRUCache(maxsize, ttl)
+    if backend == "none":
+        return LRUCache(0, ttl)
+    raise ValueError("Unknown cache backend: {}".format(backend))
+
+
+### -----------------------------------------------------------
+### CLASS Cache
+### -----------------------------------------------------------
+class Cache:
+    """
+    The interface of a cache of serialized Customers keyed by customer_id
+    """
+
+    def get(self, key):
+        """
+        Return the cached value for key, or None on a miss
+        """
+        raise NotImplementedError
+
+    def set(self, key, value):
+        """
+        Cache value under key
+        """
+        raise NotImplementedError
+
+    def generation(self, key):
+        """
+        Return a token that changes whenever key is invalidated
+
+        Read it before reading the database on a miss, and pass it to fill()
+        """
+        raise NotImplementedError
+
+    def fill(self, key, value, generation):
+        """
+        Cache value under key unless key was invalidated since generation
+
+        A reader that missed can otherwise cache the row it read after a
+        writer changed the row and deleted the entry, and that stale value
+        would be served until it expires. Returns True if value was cached.
+        """
+        raise NotImplementedError
+
+    def delete(self, key):
+        """
+        Forget the cached value for key and start a new generation of it
+        """
+        raise NotImplementedError
+
+    def clear(self):
+        """
+        Forget every cached value
+        """
+        raise NotImplementedError
+
+    def stats(self):
+        """
+        Return the counters of the cache
+        """
+        raise NotImplementedError
+
+
+### -----------------------------------------------------------
+### CLASS LRUCache
+### -----------------------------------------------------------
+class LRUCache(Cache):
+    """
+    A thread-safe cache that keeps at most maxsize entries, evicting the
+    least recently used one when full, and forgets entries older than ttl
+    seconds
+    """
+
+    def __init__(self, maxsize=1024, ttl=60, clock=time.monotonic):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self._clock = clock
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        # one generation for every key: writes are rare within one process
+        self._generation = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.expirations = 0
+
+    def get(self, key):
+        """
+        Return the cached value for key, or None on a miss
+        """
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                self.misses += 1
+                return None
+            value, expires = entry
+            if expires <= self._clock():
+                del self._entries[key]
+                self.expirations += 1
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return value
+
+    def set(self, key, value):
+        """
+        Cache value under key, evicting the least recently used entry if full
+        """
+        if self.maxsize <= 0:
+            return
+        with self._lock:
+            self._store(key, value)
+
+    def _store(self, key, value):
+        self._entries[key] = (value, self._clock() + self.ttl)
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.maxsize:
+            self._entries.popitem(last=False)
+            self.evictions += 1
+
+    def generation(self, key):
+        """
+        Return a token that changes whenever any key is invalidated
+        """
+        with self._lock:
+            return self._generation
+
+    def fill(self, key, value, generation):
+        """
+        Cache value under key unless a key was invalidated since generation
+        """
+        if self.maxsize <= 0:
+            return False
+        with self._lock:
+            if generation != self._generation:
+                return False
+            self._store(key, value)
+            return True
+
+    def delete(self, key):
+        """
+        Forget the cached value for key
+        """
+        with self._lock:
+            self._generation += 1
+            self._entries.pop(key, None)
+
+    def clear(self):
+        """
+        Forget every cached value
+        """
+        with self._lock:
+            self._generation += 1
+            self._entries.clear()
+
+    def stats(self):
+        """
+        Return the hit, miss and eviction counters of the cache
+        """
+        with self._lock:
+            return {
+                "hits": self.hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+                "expirations": self.expirations,
+                "size": len(self._entries),
+                "maxsize": self.maxsize,
+                "ttl": self.ttl
+                }
+
+
+### -----------------------------------------------------------
+### CLASS RedisCache
+### -----------------------------------------------------------
+class RedisCache(Cache):
+    """
+    A cache kept in a Redis-protocol server so that every worker and
+    instance sees the same entries and the same invalidations
+
+    Values are stored as JSON under prefixed keys and expire after ttl
+    seconds. Every key has a generation counter next to it, bumped by each
+    invalidation, and clear() bumps one shared by all keys. When the server
+    is unreachable every read is a miss, so the service keeps answering from
+    the database.
+    """
+
+    def __init__(self, client, ttl=60, prefix="customer:"):
+        self.client = client
+        self.ttl = ttl
+        self.prefix = prefix
+        self.generation_prefix = prefix.rstrip(":") + "-generation:"
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.errors = 0
+
+    def _key(self, key):
+        return "{}{}".format(self.prefix, key)
+
+    def _generation_keys(self, key):
+        return [self.generation_prefix, "{}{}".format(self.generation_prefix, key)]
+
+    def _count(self, counter):
+        with self._lock:
+            setattr(self, counter, getattr(self, counter) + 1)
+
+    def get(self, key):
+        """
+        Return the cached value for key, or None on a miss
+        """
+        try:
+            value = self.client.get(self._key(key))
+        except RedisError as error:
+            logger.warning("Cache read failed: %s", error)
+            self._count("errors")
+            value = None
+        if value is None:
+            self._count("misses")
+            return None
+        self._count("hits")
+        return json.loads(value)
+
+    def set(self, key, value):
+        """
+        Cache value under key until the TTL runs out
+        """
+        try:
+            self.client.setex(self._key(key), self.ttl, json.dumps(value))
+        except RedisError as error:
+            logger.warning("Cache write failed: %s", error)
+            self._count("errors")
+
+    def generation(self, key):
+        """
+        Return the generations of every key and of key, or None if unknown
+        """
+        try:
+            return self.client.mget(self._generation_keys(key))
+        except RedisError as error:
+            logger.warning("Cache read failed: %s", error)
+            self._count("errors")
+            return None
+
+    def fill(self, key, value, generation):
+        """
+        Cache value under key unless key was invalidated since generation
+        """
+        if generation is None:
+            return False
+        generation_keys = self._generation_keys(key)
+        try:
+            with self.client.pipeline() as pipe:
+                pipe.watch(*generation_keys)
+                if pipe.mget(generation_keys) != generation:
+                    return False
+                pipe.multi()
+                pipe.setex(self._key(key), self.ttl, json.dumps(value))
+                pipe.execute()
+                return True
+        except WatchError:
+            return False
+        except RedisError as error:
+            logger.warning("Cache write failed: %s", error)
+            self._count("errors")
+            return False
+
+    def delete(self, key):
+        """
+        Forget the cached value for key and start a new generation of it
+        """
+        _, generation_key = self._generation_keys(key)
+        try:
+            pipe = self.client.pipeline()
+            pipe.incr(generation_key)
+            # outlives any fill still in flight, since those take far less than a TTL
+            pipe.expire(generation_key, self.ttl)
+            pipe.delete(self._key(key))
+            pipe.execute()
+        except RedisError as error:
+            logger.error("Cache invalidation failed: %s", error)
+            self._count("errors")
+
+    def clear(self):
+        """
+        Forget every cached value under this cache's prefix
+        """
+        try:
+            self.client.incr(self.generation_prefix)
+            keys = list(self.client.scan_iter(match=self.prefix + "*"))
+            if keys:
+                self.client.delete(*keys)
+        except RedisError as error:
+            logger.error("Cache invalidation failed: %s", error)
+            self._count("errors")
+
+    def stats(self):
+        """
+        Return the hit, miss and error counters of this worker
+        """
+        with self._lock:
+            return {
+                "hits": self.hits,
+                "misses": self.misses,
+                "errors": self.errors,
+                "ttl": self.ttl
+                }
@@ -0,0 +1,125 @@
+# Copyright 2016, 2021 John J. Rofrano. All Rights Reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+# https://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+### -----------------------------------------------------------
+###  Modified by DevOps Course Summer 2021 Customer Team
+###  Members:
+###     Du, Li | ld2342@nyu.edu | Nanjing | GMT+8
+###     Cai, Shuhong | sc8540@nyu.edu | Shanghai | GMT+8
+###     Zhang, Teng | tz2179@nyu.edu | Ningbo | GMT+8
+###     Zhang, Ken | sz1851@nyu.edu | Shanghai | GMT+8
+###     Wang,Yu-Hsing | yw5629@nyu.edu | Taiwan | GMT+8
+### -----------------------------------------------------------
+
+"""
+Prometheus metrics of the Customer Service
+
+Every request is counted and timed per flask-restx resource (or per view for
+plain Flask routes), together with the number of SQL statements it ran and
+the time spent in them. GET /metrics exports them in the Prometheus text
+format.
+
+In debug mode every response also carries X-DB-Queries and Server-Timing
+headers with the statements and SQL time of its request.
+
+When PROMETHEUS_MULTIPROC_DIR is set (gunicorn.conf.py sets it) every worker
+writes its samples there and /metrics adds up the samples of all workers.
+"""
+
+import os
+import time
+from flask import g, request, Response
+from prometheus_client import CollectorRegistry, Counter, Gauge, Histogram, \
+    generate_latest, CONTENT_TYPE_LATEST, REGISTRY
+from prometheus_client import multiprocess
+
+# Import Flask application
+from . import app
+
+REQUESTS = Counter(
+    "customer_http_requests_total", "HTTP requests handled",
+    ["resource", "method", "status"])
+LATENCY = Histogram(
+    "customer_http_request_duration_seconds", "Time to handle an HTTP request",
+    ["resource", "method"])
+IN_PROGRESS = Gauge(
+    "customer_http_requests_in_progress", "HTTP requests being handled",
+    ["resource", "method"], multiprocess_mode="livesum")
+DB_QUERIES = Histogram(
+    "customer_db_queries_per_request", "SQL statements run by one HTTP request",
+    ["resource", "method"], buckets=(0, 1, 2, 3, 5, 10, 20, 50, 100, float("inf")))
+DB_DURATION = Histogram(
+    "customer_db_duration_seconds_per_request", "Time one HTTP request spent in SQL",
+    ["resource", "method"])
+
+
+def resource_name():
+    """Returns the flask-restx Resource (or Flask view) handling the request"""
+    view = app.view_functions.get(request.endpoint)
+    if view is None:
+        return "none"
+    return getattr(view, "view_class", view).__name__
+
+
+def registry():
+    """Returns the registry holding the samples of every worker"""
+    if "PROMETHEUS_MULTIPROC_DIR" not in os.environ:
+        return REGISTRY
+    collector = CollectorRegistry()
+    multiprocess.MultiProcessCollector(collector)
+    return collector
+
+
+@app.before_request
+def start_request_metrics():
+    """Starts the clock and the in-progress gauge of a request"""
+    g.metrics_labels = (resource_name(), request.method)
+    g.metrics_start = time.perf_counter()
+    g.db_queries = 0
+    g.db_seconds = 0.0
+    IN_PROGRESS.labels(*g.metrics_labels).inc()
+
+
+@app.after_request
+def record_request_metrics(response):
+    """Records the status, latency and SQL statements of a request"""
+    labels = g.get("metrics_labels")
+    if labels is None:
+        return response
+    elapsed = time.perf_counter() - g.metrics_start
+    LATENCY.labels(*labels).observe(elapsed)
+    REQUESTS.labels(labels[0], labels[1], str(response.status_code)).inc()
+    DB_QUERIES.labels(*labels).observe(g.db_queries)
+    DB_DURATION.labels(*labels).observe(g.db_seconds)
+    if app.debug:
+        response.headers["X-DB-Queries"] = str(g.db_queries)
+        response.headers["Server-Timing"] = 'db;dur={:.3f};desc="{} queries", ' \
+            'total;dur={:.3f}'.format(g.db_seconds * 1000, g.db_queries, elapsed * 1000)
+    return response
+
+
+@app.teardown_request
+def end_request_metrics(error=None):  # pylint: disable=unused-argument
+    """Takes the request out of the in-progress gauge, even when it failed"""
+    labels = g.pop("metrics_labels", None)
+    if labels is not None:
+        IN_PROGRESS.labels(*labels).dec()
+
+
+@app.route("/metrics")
+def metrics():
+    """
+    Prometheus metrics of the service
+    """
+    return Response(generate_latest(registry()), mimetype=CONTENT_TYPE_LATEST)
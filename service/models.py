@@ -37,15 +37,45 @@ last_name (string) - The last name of the customer
 user_id (string) - User ID of the customer, generated by the user, UNIQUE
 password (string) - Password of the customer, generated by the user
 address_id(int) - ID of the customer's primary address
+version (int) - Row version, bumped by every update of the customer
 """
 
+import time
 import logging
+import functools
+import threading
 import sqlalchemy
-from flask_sqlalchemy import SQLAlchemy
+from sqlalchemy import orm, event
+from sqlalchemy.pool import QueuePool
+from flask import g, request, has_request_context
+from flask_sqlalchemy import SQLAlchemy, SignallingSession
 
 
 logger = logging.getLogger("flask.app")
-db = SQLAlchemy()
+
+
+class RoutingSession(SignallingSession):
+    """
+    A session that sends its queries to a read replica while one is
+    selected, and everything it flushes to the primary
+    """
+    replica = None
+
+    def get_bind(self, mapper=None, clause=None):
+        if self.replica is not None and not self._flushing:
+            return self.replica
+        return super().get_bind(mapper, clause)
+
+
+class RoutingSQLAlchemy(SQLAlchemy):
+    """
+    Flask-SQLAlchemy with sessions that can be routed to read replicas
+    """
+    def create_session(self, options):
+        return orm.sessionmaker(class_=RoutingSession, db=self, **options)
+
+
+db = RoutingSQLAlchemy()
 
 
 def init_db(app):
@@ -53,9 +83,277 @@ def init_db(app):
     Customer.init_db(app)
 
 
+def engine_options(config):
+    """Returns the SQLAlchemy engine options for the configured database
+
+    Pool sizing only applies to databases served from a QueuePool, so it is
+    left out for SQLite.
+    """
+    options = {
+        "pool_pre_ping": config["DB_POOL_PRE_PING"],
+        "pool_recycle": config["DB_POOL_RECYCLE"],
+    }
+    url = sqlalchemy.engine.url.make_url(config["SQLALCHEMY_DATABASE_URI"])
+    if url.get_backend_name() != "sqlite":
+        options.update(
+            poolclass=MonitoredQueuePool,
+            pool_size=config["DB_POOL_SIZE"],
+            max_overflow=config["DB_MAX_OVERFLOW"],
+            pool_timeout=config["DB_POOL_TIMEOUT"],
+        )
+    return options
+
+
+class ReadReplicas:
+    """
+    The read replicas of the database, handed out round-robin
+
+    A replica that fails is skipped for retry_after seconds, during which
+    its reads go to the primary.
+    """
+
+    def __init__(self, retry_after=30, clock=time.monotonic):
+        self.retry_after = retry_after
+        self._clock = clock
+        self._lock = threading.Lock()
+        self.engines = []
+        self._next = 0
+        self._down_until = {}
+
+    def configure(self, uris, config):
+        """Connects to the replicas at the given URIs"""
+        self.dispose()
+        self.engines = [sqlalchemy.create_engine(
+            uri, **engine_options(dict(config, SQLALCHEMY_DATABASE_URI=uri))) for uri in uris]
+        for engine in self.engines:
+            queries.install(engine)
+        logger.info("Using %d read replicas", len(self.engines))
+
+    def dispose(self):
+        """Closes the connections to every replica"""
+        with self._lock:
+            for engine in self.engines:
+                engine.dispose()
+            self._next = 0
+            self._down_until = {}
+
+    def pick(self):
+        """Returns the next healthy replica, or None to use the primary"""
+        with self._lock:
+            now = self._clock()
+            for _ in range(len(self.engines)):
+                engine = self.engines[self._next]
+                self._next = (self._next + 1) % len(self.engines)
+                if self._down_until.get(engine, 0) <= now:
+                    return engine
+        return None
+
+    def mark_down(self, engine):
+        """Skips a failed replica for a while"""
+        with self._lock:
+            self._down_until[engine] = self._clock() + self.retry_after
+
+
+replicas = ReadReplicas()
+
+
+def read_replica(func):
+    """Runs a read-only function against a read replica
+
+    If the replica fails the function is run again against the primary.
+    """
+    @functools.wraps(func)
+    def wrapper(*args, **kwargs):
+        engine = replicas.pick()
+        if engine is not None:
+            session = db.session()
+            session.replica = engine
+            try:
+                return func(*args, **kwargs)
+            except sqlalchemy.exc.OperationalError as error:
+                logger.warning("Read replica %s failed, using the primary: %s",
+                               engine.url, error)
+                session.rollback()
+                replicas.mark_down(engine)
+            finally:
+                session.replica = None
+        return func(*args, **kwargs)
+    return wrapper
+
+
+def pool_stats():
+    """Returns the statistics of the database connection pool"""
+    pool = db.engine.pool
+    stats = {"class": type(pool).__name__}
+    if isinstance(pool, QueuePool):
+        stats.update(size=pool.size(), checked_in=pool.checkedin(),
+                     checked_out=pool.checkedout(), overflow=pool.overflow())
+    if isinstance(pool, MonitoredQueuePool):
+        stats.update(pool.counters())
+    return stats
+
+
+class MonitoredQueuePool(QueuePool):
+    """
+    A QueuePool that counts how often a checkout had to wait for a
+    connection to be returned, and for how long
+    """
+
+    def __init__(self, creator, pool_size=5, max_overflow=10, **kwargs):
+        super().__init__(creator, pool_size=pool_size, max_overflow=max_overflow, **kwargs)
+        # every connection the pool may open, overflow included (None: no limit)
+        self.capacity = None if max_overflow < 0 else pool_size + max_overflow
+        self._counter_lock = threading.Lock()
+        self.waits = 0
+        self.wait_seconds = 0.0
+        self.timeouts = 0
+
+    def connect(self):
+        """Checks out a connection, counting the checkouts that had to wait"""
+        # the pool blocks once every connection it may open is checked out
+        if self.capacity is None or self.checkedout() < self.capacity:
+            return super().connect()
+        start = time.perf_counter()
+        try:
+            return super().connect()
+        except sqlalchemy.exc.TimeoutError:
+            with self._counter_lock:
+                self.timeouts += 1
+            raise
+        finally:
+            with self._counter_lock:
+                self.waits += 1
+                self.wait_seconds += time.perf_counter() - start
+
+    def counters(self):
+        """Returns the wait counters of the pool"""
+        with self._counter_lock:
+            return {"waits": self.waits, "wait_seconds": round(self.wait_seconds, 6),
+                    "timeouts": self.timeouts}
+
+
+class QueryRecorder:
+    """
+    Counts the SQL statements run for each request, and their time, and logs
+    the statements slower than slow_seconds with the route that ran them
+
+    The totals are added to db_queries and db_seconds on flask.g, which
+    service.metrics resets at the start of every request.
+    """
+
+    def __init__(self, slow_seconds=0.5):
+        self.slow_seconds = slow_seconds
+
+    def install(self, engine):
+        """Starts recording the statements an engine runs"""
+        if event.contains(engine, "before_cursor_execute", self.start):
+            return
+        event.listen(engine, "before_cursor_execute", self.start)
+        event.listen(engine, "after_cursor_execute", self.end)
+        event.listen(engine, "handle_error", self.fail)
+
+    def start(self, conn, cursor, statement, parameters, context, executemany):
+        """Notes when a statement started"""
+        # pylint: disable=unused-argument,too-many-arguments
+        conn.info.setdefault("query_start", []).append(time.perf_counter())
+
+    def end(self, conn, cursor, statement, parameters, context, executemany):
+        """Adds a finished statement to the totals of the current request"""
+        # pylint: disable=unused-argument,too-many-arguments
+        elapsed = time.perf_counter() - conn.info["query_start"].pop()
+        route = "-"
+        if has_request_context():
+            g.db_queries = g.get("db_queries", 0) + 1
+            g.db_seconds = g.get("db_seconds", 0.0) + elapsed
+            rule = request.url_rule.rule if request.url_rule else request.path
+            route = "{} {}".format(request.method, rule)
+        if elapsed >= self.slow_seconds:
+            # parameters are left out, they may hold passwords
+            logger.warning("Slow query (%.3f s) from %s: %s", elapsed, route, statement)
+
+    @staticmethod
+    def fail(context):
+        """Forgets the start of a statement that failed"""
+        if context.connection is None:  # the connection itself failed
+            return
+        starts = context.connection.info.get("query_start")
+        if starts:
+            starts.pop()
+
+
+queries = QueryRecorder()
+
+
+def upgrade_tables():
+    """Creates any model column or index that is missing from an existing table
+
+    db.create_all() only creates columns and indexes together with new
+    tables, so this adds those introduced after a table was first deployed.
+    New columns must be nullable or have a server default. It is a one-off
+    migration (flask upgrade-db), not run at startup: on PostgreSQL indexes
+    are built CONCURRENTLY so writes go on meanwhile, and every statement is
+    IF NOT EXISTS so running it twice, or from two places, is harmless.
+    """
+    postgresql = db.engine.dialect.name == "postgresql"
+    if_not_exists = "IF NOT EXISTS " if postgresql else ""
+    index_options = "CONCURRENTLY IF NOT EXISTS " if postgresql else "IF NOT EXISTS "
+    inspector = sqlalchemy.inspect(db.engine)
+    with db.engine.connect() as conn:
+        # CREATE INDEX CONCURRENTLY cannot run inside a transaction
+        conn = conn.execution_options(isolation_level="AUTOCOMMIT")
+        for table in (Customer.__table__, Address.__table__):
+            columns = {column["name"] for column in inspector.get_columns(table.name)}
+            for column in table.columns:
+                if column.name not in columns:
+                    logger.info("Adding column %s.%s", table.name, column.name)
+                    ddl = "ALTER TABLE {} ADD COLUMN {}{} {}".format(
+                        table.name, if_not_exists, column.name,
+                        column.type.compile(dialect=db.engine.dialect))
+                    if column.server_default is not None:
+                        ddl += " DEFAULT {}".format(column.server_default.arg)
+                    if not column.nullable:
+                        ddl += " NOT NULL"
+                    conn.execute(ddl)
+            existing = {index["name"] for index in inspector.get_indexes(table.name)}
+            for index in table.indexes:
+                if index.name not in existing:
+                    logger.info("Creating index %s", index.name)
+                    ddl = str(sqlalchemy.schema.CreateIndex(index).compile(conn))
+                    create = "CREATE UNIQUE INDEX " if index.unique else "CREATE INDEX "
+                    conn.execute(ddl.replace(create, create + index_options, 1))
+
+
+def truncate(*models):
+    """Empties the tables of the given models without loading any rows
+
+    PostgreSQL uses a single TRUNCATE; other databases fall back to one
+    set-based DELETE per table, in the order given.
+    """
+    if db.engine.dialect.name == "postgresql":
+        tables = ", ".join(model.__table__.name for model in models)
+        db.session.execute("TRUNCATE TABLE {}".format(tables))
+    else:
+        for model in models:
+            model.query.delete(synchronize_session=False)
+    db.session.commit()
+
+
+# Column layout of the rows returned by Customer.search_rows
+CUSTOMER_ROW_COLUMNS = ("customer_id", "first_name", "last_name", "user_id", "password",
+                        "active", "version")
+ADDRESS_ROW_COLUMNS = ("id", "street", "apartment", "city", "state", "zip_code", "version")
+
+# Most values bound into one IN (...) list
+IN_BATCH_SIZE = 1000
+
+
 class DataValidationError(Exception):
     """Used for an data validation errors when deserializing"""
 
+
+class DataConflictError(Exception):
+    """Used when a row was changed by another request since it was read"""
+
 ### -----------------------------------------------------------
 ### CLASS Customer
 ### -----------------------------------------------------------
@@ -69,12 +367,25 @@ class Customer(db.Model):
 
     # Table Schema (Attributes)
     customer_id = db.Column(db.Integer, primary_key=True)
-    first_name = db.Column(db.String(50), nullable=False)
-    last_name = db.Column(db.String(50), nullable=False)
+    first_name = db.Column(db.String(50), nullable=False, index=True)
+    last_name = db.Column(db.String(50), nullable=False, index=True)
     user_id = db.Column(db.String(50), nullable=False, unique=True)
     password = db.Column(db.String(50), nullable=False)
-    active = db.Column(db.Boolean, nullable=False)
+    active = db.Column(db.Boolean, nullable=False, index=True)
     address_id = db.Column(db.Integer, nullable=True)
+    version = db.Column(db.Integer, nullable=False, server_default="1")
+
+    # Every UPDATE bumps the version and fails if it changed since the read
+    __mapper_args__ = {"version_id_col": version}
+
+    # The primary Address is loaded in the same SELECT as the Customer
+    # (LEFT OUTER JOIN) so listing Customers never issues per-row lookups
+    address = db.relationship("Address",
+                              primaryjoin="Customer.address_id == Address.id",
+                              foreign_keys=[address_id],
+                              uselist=False,
+                              viewonly=True,
+                              lazy="joined")
 
     ### -----------------------------------------------------------
     ### INSTANCE METHODS
@@ -93,9 +404,20 @@ class Customer(db.Model):
             "user_id": self.user_id,
             "password": self.password,
             "active": self.active,
-            "address": Address.find(self.address_id)
+            "address": self.address.serialize() if self.address else None
             }
 
+    def version_tag(self):
+        """
+        Return what identifies this version of the serialized Customer
+
+        The tuple changes whenever the Customer or its Address is updated,
+        so it can be turned into an ETag without serializing the Customer.
+        """
+        if self.address is None:
+            return (self.customer_id, self.version, None, None)
+        return (self.customer_id, self.version, self.address.id, self.address.version)
+
     def alternative_serialize(self):
         """
         Serialize a Customer into a dictionary (Internal)
@@ -124,18 +446,38 @@ class Customer(db.Model):
             raise DataValidationError("Invalid Customer: Type Error\n{}".format(error))
         return self
 
-    def save(self):
+    def save(self, commit=True):
         """
         Save a Customer
+
+        With commit=False the Customer is only flushed, which assigns its
+        customer_id but leaves the transaction open for related rows.
         """
         logger.info('Saving %s %s', self.first_name, self.last_name)
         db.session.add(self)
         try:
-            db.session.commit()
-            logger.info('Customer saved!')
-        except sqlalchemy.exc.IntegrityError as error:
+            if commit:
+                db.session.commit()
+                logger.info('Customer saved!')
+            else:
+                db.session.flush()
+        except sqlalchemy.exc.IntegrityError:
             db.session.rollback()
             raise DataValidationError("User ID already exists")
+        except sqlalchemy.orm.exc.StaleDataError:
+            db.session.rollback()
+            raise DataConflictError("Customer was changed by another request")
+
+    def create(self, address):
+        """
+        Create a Customer and its Address in a single transaction
+        """
+        logger.info('Creating %s %s', self.first_name, self.last_name)
+        self.save(commit=False)
+        address.customer_id = self.customer_id
+        address.save(commit=False)
+        self.address_id = address.id
+        self.save()
 
 
     def delete(self):
@@ -157,10 +499,14 @@ class Customer(db.Model):
         """
         logger.info('Initializing database')
         cls.app = app
+        app.config.setdefault("SQLALCHEMY_ENGINE_OPTIONS", engine_options(app.config))
         # This is where we initialize SQLAlchemy from the Flask app
         db.init_app(app)
         app.app_context().push()
-        db.create_all()  # make our sqlalchemy tables
+        queries.slow_seconds = app.config["DB_SLOW_QUERY_SECONDS"]
+        queries.install(db.engine)
+        db.create_all()  # make our sqlalchemy tables; run "flask upgrade-db" for older ones
+        replicas.configure(app.config["DATABASE_REPLICA_URIS"], app.config)
 
     @classmethod
     def all(cls):
@@ -171,13 +517,102 @@ class Customer(db.Model):
         return cls.query.all()
 
     @classmethod
-    def remove_all(cls):
+    def bulk_create(cls, customers):
+        """Creates many Customers and their Addresses in a single transaction
+
+        Rows are written with executemany bulk inserts and the generated IDs
+        are read back by the unique user_id, so the number of statements does
+        not grow with the number of Customers.
+
+        :param customers: pairs of unsaved Customers and their Addresses
+        :type customers: list
+
+        :return: the new customer_ids in the same order as the pairs
+        :rtype: list
+
+        """
+        logger.info("Bulk creating %d Customers", len(customers))
+        if not customers:
+            return []
+        user_ids = [customer.user_id for customer, _ in customers]
+        try:
+            db.session.bulk_insert_mappings(
+                cls, [customer.alternative_serialize() for customer, _ in customers])
+            customer_ids = dict(db.session.query(cls.user_id, cls.customer_id)
+                                .filter(cls.user_id.in_(user_ids)))
+            address_rows = []
+            for customer, address in customers:
+                row = address.serialize()
+                del row["id"]
+                row["customer_id"] = customer_ids[customer.user_id]
+                address_rows.append(row)
+            db.session.bulk_insert_mappings(Address, address_rows)
+            address_ids = db.session.query(Address.customer_id, Address.id) \
+                .filter(Address.customer_id.in_(customer_ids.values()))
+            db.session.bulk_update_mappings(
+                cls, [{"customer_id": customer_id, "address_id": address_id, "version": 1}
+                      for customer_id, address_id in address_ids])
+            db.session.commit()
+            logger.info('Customers saved!')
+        except sqlalchemy.exc.IntegrityError:
+            db.session.rollback()
+            raise DataValidationError("User ID already exists")
+        return [customer_ids[user_id] for user_id in user_ids]
+
+    @classmethod
+    def find_user_ids(cls, user_ids):
+        """Returns which of the given user ids already belong to Customers
+
+        :param user_ids: the user ids to look up
+        :type user_ids: list
+
+        :return: the user ids that are already taken
+        :rtype: set
+
         """
-        Remove all Customers from the database
+        logger.info("Processing user id lookup for %d user ids ...", len(user_ids))
+        if not user_ids:
+            return set()
+        query = db.session.query(cls.user_id).filter(cls.user_id.in_(user_ids))
+        return {user_id for user_id, in query}
+
+    @classmethod
+    def stream(cls, batch_size=1000):
+        """Returns an iterator over all Customers fetched in batches
+
+        The rows are read through a server-side cursor (where the database
+        supports one) so memory stays flat no matter how many Customers exist.
+
+        :param batch_size: the number of Customers fetched per round trip
+        :type batch_size: int
+
+        :return: an iterator of Customers ordered by customer_id
+        :rtype: Query
+
         """
-        for customer in cls.query.all():
-            db.session.delete(customer)
+        logger.info("Streaming all Customers in batches of %d", batch_size)
+        return cls.query.order_by(cls.customer_id).yield_per(batch_size)
+
+    @classmethod
+    def remove_all(cls, active=None):
+        """
+        Remove all Customers (and their Addresses) from the database
+
+        When active is given only Customers with that active status are
+        removed, e.g. active=False purges every deactivated account.
+        Returns the number of Customers removed, or None after a TRUNCATE.
+        """
+        if active is None:
+            logger.info('Removing all Customers')
+            truncate(Address, cls)
+            return None
+        logger.info('Removing Customers with active status %s', active)
+        customer_ids = sqlalchemy.select([cls.customer_id]).where(cls.active == active)
+        Address.query.filter(Address.customer_id.in_(customer_ids)) \
+            .delete(synchronize_session=False)
+        count = cls.query.filter(cls.active == active).delete(synchronize_session=False)
         db.session.commit()
+        return count
 
     @staticmethod
     def disconnect():
@@ -196,6 +631,297 @@ class Customer(db.Model):
             return cls.query.filter(cls.customer_id == customer_id and cls.active).first()
         return cls.query.filter(cls.customer_id == customer_id).first()
 
+    @classmethod
+    def search_criteria(cls, **filters):
+        """Returns the WHERE criteria for the search filters that are not None
+
+        :return: the criteria on Customer columns and on Address columns
+        :rtype: tuple
+
+        """
+        logger.info("Processing search query for %s ...", filters)
+        customer_criteria = []
+        address_criteria = []
+        for name, value in filters.items():
+            if value is None:
+                continue
+            if name in ("city", "state", "zip_code"):
+                address_criteria.append(getattr(Address, name) == value)
+            else:
+                customer_criteria.append(getattr(cls, name) == value)
+        return customer_criteria, address_criteria
+
+    @classmethod
+    def search_rows(cls, after=None, limit=None, customer_ids=None,
+                    customer_columns=CUSTOMER_ROW_COLUMNS, address_columns=ADDRESS_ROW_COLUMNS,
+                    **filters):
+        """Returns one page of matching Customers as plain rows
+
+        The filters are first_name, last_name, active, user_id, city, state
+        and zip_code; those that are None are ignored. Customers are ordered
+        by customer_id and the page starts right after the given customer_id,
+        so every page is an index range scan no matter how deep the client
+        pages. The Customer and Address columns are read with one Core
+        SELECT, without building ORM objects. Every row holds the
+        customer_columns followed by the address_columns (all None when the
+        Customer has no Address). The Address is not joined at all when no
+        address_columns are asked for.
+
+        :param after: only return Customers with a greater customer_id
+        :type after: int
+        :param limit: the maximum number of Customers to return
+        :type limit: int
+        :param customer_ids: only return these Customers
+        :type customer_ids: list
+        :param customer_columns: the Customer columns to read, customer_id first
+        :type customer_columns: tuple
+        :param address_columns: the Address columns to read
+        :type address_columns: tuple
+
+        :return: the rows on the page and whether more Customers remain
+        :rtype: tuple
+
+        """
+        query = cls.search_select(after, limit, customer_ids, customer_columns,
+                                  address_columns, **filters)
+        rows = db.session.execute(query).fetchall()
+        if limit is None:
+            return rows, False
+        return rows[:limit], len(rows) > limit
+
+    @classmethod
+    def search_select(cls, after=None, limit=None, customer_ids=None,
+                      customer_columns=CUSTOMER_ROW_COLUMNS, address_columns=ADDRESS_ROW_COLUMNS,
+                      **filters):
+        """Returns the SELECT that search_rows() runs
+
+        It reads one row more than the limit, to tell whether more
+        Customers remain.
+
+        :return: a SELECT of the matching Customer rows
+        :rtype: Select
+
+        """
+        customers = cls.__table__
+        customer_criteria, address_criteria = cls.search_criteria(**filters)
+        if address_criteria and not address_columns:
+            customer_criteria.append(cls.address_matches(address_criteria))
+            address_criteria = []
+        query = cls.row_select(customers, customer_columns, address_columns)
+        for criterion in customer_criteria + address_criteria:
+            query = query.where(criterion)
+        if after is not None:
+            query = query.where(customers.c.customer_id > after)
+        if customer_ids is not None:
+            query = query.where(customers.c.customer_id.in_(customer_ids))
+        query = query.order_by(customers.c.customer_id)
+        if limit is not None:
+            query = query.limit(limit + 1)
+        return query
+
+    @staticmethod
+    def row_select(customers, customer_columns=CUSTOMER_ROW_COLUMNS,
+                   address_columns=ADDRESS_ROW_COLUMNS):
+        """Returns a SELECT of Customer rows joined with their Address
+
+        :param customers: the customer table, or a CTE with the same columns
+        :type customers: FromClause
+        :param customer_columns: the Customer columns to select
+        :type customer_columns: tuple
+        :param address_columns: the Address columns to select; without any
+            the Address is not joined
+        :type address_columns: tuple
+
+        :return: a SELECT of the customer_columns and address_columns
+        :rtype: Select
+
+        """
+        columns = [customers.c[name] for name in customer_columns]
+        if not address_columns:
+            return sqlalchemy.select(columns)
+        addresses = Address.__table__
+        return sqlalchemy.select(
+            columns + [addresses.c[name] for name in address_columns]
+        ).select_from(customers.outerjoin(addresses, customers.c.address_id == addresses.c.id))
+
+    @staticmethod
+    def address_matches(address_criteria):
+        """Returns a criterion on Customers whose primary Address matches
+
+        :param address_criteria: criteria on Address columns
+        :type address_criteria: list
+
+        :return: customer.address_id IN (SELECT id FROM address WHERE ...)
+        :rtype: ClauseElement
+
+        """
+        address_ids = sqlalchemy.select([Address.id]).where(sqlalchemy.and_(*address_criteria))
+        return Customer.address_id.in_(address_ids)
+
+    @classmethod
+    def set_active(cls, customer_id, active):
+        """Sets the active status of a Customer with one atomic UPDATE
+
+        The UPDATE also bumps the version, like every other update. On
+        PostgreSQL it runs as UPDATE ... RETURNING joined with the Address,
+        so the whole change is a single statement; other databases read the
+        row back in the same transaction.
+
+        :param customer_id: the id of the Customer to change
+        :type customer_id: int
+        :param active: the new active status
+        :type active: bool
+
+        :return: the updated row laid out like search_rows(), or None if
+            there is no such Customer
+        :rtype: RowProxy
+
+        """
+        logger.info("Setting active status of customer %s to %s", customer_id, active)
+        *updates, select = cls.set_active_statements(customer_id, active,
+                                                     db.engine.dialect.name)
+        for update in updates:
+            db.session.execute(update)
+        row = db.session.execute(select).first()
+        db.session.commit()
+        return row
+
+    @classmethod
+    def set_active_statements(cls, customer_id, active, dialect_name):
+        """Returns the statements that set_active() runs in one transaction
+
+        :param dialect_name: the name of the database dialect
+        :type dialect_name: str
+
+        :return: the statements in order; the last one returns the row
+        :rtype: list
+
+        """
+        customers = cls.__table__
+        update = customers.update() \
+            .where(customers.c.customer_id == customer_id) \
+            .values(active=active, version=customers.c.version + 1)
+        if dialect_name == "postgresql":
+            return [cls.row_select(update.returning(*customers.c).cte("updated"))]
+        return [update,
+                cls.row_select(customers).where(customers.c.customer_id == customer_id)]
+
+    @classmethod
+    def patch(cls, customer_id, changes, address_changes=None, active=None, versions=None):
+        """Updates only the given columns of a Customer and its Address
+
+        Runs at most one UPDATE per table, each bumping that row's version,
+        and reads the result back with the same SELECT as search_rows(), all
+        in one transaction. Nothing is read before the UPDATEs; the checks on
+        active and versions are part of their WHERE clauses.
+
+        :param changes: the new values of Customer columns
+        :type changes: dict
+        :param address_changes: the new values of Address columns
+        :type address_changes: dict
+        :param active: only update the Customer while it has this active status
+        :type active: bool
+        :param versions: the Customer and Address versions the rows must still have
+        :type versions: tuple
+
+        :return: the updated row laid out like search_rows(), or None if
+            there is no such Customer
+        :rtype: RowProxy
+
+        """
+        logger.info("Patching customer %s", customer_id)
+        customers = cls.__table__
+        addresses = Address.__table__
+        criteria = [customers.c.customer_id == customer_id]
+        if active is not None:
+            criteria.append(customers.c.active == active)
+        if versions is not None:
+            criteria.append(customers.c.version == versions[0])
+        statements = []
+        if address_changes:
+            address_ids = sqlalchemy.select([customers.c.address_id]) \
+                .where(sqlalchemy.and_(*criteria))
+            address_criteria = [addresses.c.id.in_(address_ids)]
+            if versions is not None:
+                address_criteria.append(addresses.c.version == versions[1])
+            statements.append(addresses.update()
+                              .where(sqlalchemy.and_(*address_criteria))
+                              .values(version=addresses.c.version + 1, **address_changes))
+        if changes:
+            statements.append(customers.update()
+                              .where(sqlalchemy.and_(*criteria))
+                              .values(version=customers.c.version + 1, **changes))
+        select = cls.row_select(customers).where(customers.c.customer_id == customer_id)
+        try:
+            for statement in statements:
+                if db.session.execute(statement).rowcount == 0:
+                    db.session.rollback()
+                    return cls._patch_failed(db.session.execute(select).first(), active)
+        except sqlalchemy.exc.IntegrityError:
+            db.session.rollback()
+            raise DataValidationError("User ID already exists")
+        row = db.session.execute(select).first()
+        db.session.commit()
+        if row is not None and active is not None and not statements:
+            cls._check_active(row, active)
+        return row
+
+    @staticmethod
+    def _check_active(row, active):
+        """Refuses to change the active status of a Customer row"""
+        if row[CUSTOMER_ROW_COLUMNS.index("active")] != active:
+            raise DataValidationError("Not allowed to change active field while updating, "
+                                      "please use Activate/Deactivate button.")
+
+    @classmethod
+    def _patch_failed(cls, row, active):
+        """Explains why patch() did not match the Customer row"""
+        if row is None:
+            return None
+        if active is not None:
+            cls._check_active(row, active)
+        if row[len(CUSTOMER_ROW_COLUMNS)] is None:
+            raise DataValidationError("Customer has no Address to update")
+        raise DataConflictError("Customer was changed by another request")
+
+    @classmethod
+    def bulk_set_active(cls, value, customer_ids=None, **filters):
+        """Sets the active status of many Customers with set-based UPDATEs
+
+        Customers are picked by their customer_ids, by the search_rows() filters or
+        by both. Only Customers whose status changes are updated, and their
+        version is bumped as in set_active(). Long ID lists are updated
+        IN_BATCH_SIZE at a time, all in one transaction.
+
+        :param value: the new active status
+        :type value: bool
+        :param customer_ids: only update these Customers
+        :type customer_ids: list
+
+        :return: the number of Customers updated
+        :rtype: int
+
+        """
+        logger.info("Setting active status of customers to %s", value)
+        customers = cls.__table__
+        customer_criteria, address_criteria = cls.search_criteria(**filters)
+        criteria = customer_criteria + [customers.c.active != value]
+        if address_criteria:
+            criteria.append(cls.address_matches(address_criteria))
+        update = customers.update() \
+            .where(sqlalchemy.and_(*criteria)) \
+            .values(active=value, version=customers.c.version + 1)
+        if customer_ids is None:
+            statements = [update]
+        else:
+            statements = [
+                update.where(customers.c.customer_id.in_(customer_ids[start:start + IN_BATCH_SIZE]))
+                for start in range(0, len(customer_ids), IN_BATCH_SIZE)
+            ]
+        count = sum(db.session.execute(statement).rowcount for statement in statements)
+        db.session.commit()
+        return count
+
     @classmethod
     def find_by_first_name(cls, first_name):
         """Returns all Customers with the given first name
@@ -267,8 +993,12 @@ class Address(db.Model):
     apartment = db.Column(db.String)
     city = db.Column(db.String)
     state = db.Column(db.String)
-    zip_code = db.Column(db.String)
-    customer_id = db.Column(db.Integer, db.ForeignKey('customer.customer_id'), nullable=False)
+    zip_code = db.Column(db.String, index=True)
+    customer_id = db.Column(db.Integer, db.ForeignKey('customer.customer_id'), nullable=False,
+                            index=True)
+    version = db.Column(db.Integer, nullable=False, server_default="1")
+
+    __mapper_args__ = {"version_id_col": version}
 
     ### -----------------------------------------------------------
     ### INSTANCE METHODS
@@ -302,15 +1032,20 @@ class Address(db.Model):
             raise DataValidationError("Invalid Customer: Type Error\n{}".format(error))
         return self
 
-    def save(self):
+    def save(self, commit=True):
         """
         Save an Address
+
+        With commit=False the Address is only flushed, which assigns its id
+        but leaves the transaction open for related rows.
         """
         logger.info('Saving %s %s', self.street, self.apartment)
-        if not self.id:
-            db.session.add(self)
-        db.session.commit()
-        logger.info('Address saved!')
+        db.session.add(self)
+        if commit:
+            db.session.commit()
+            logger.info('Address saved!')
+        else:
+            db.session.flush()
 
     ### -----------------------------------------------------------
     ### CLASS METHODS
@@ -338,7 +1073,8 @@ class Address(db.Model):
         Update an Address by its ID
         """
         logger.info('Update Address for id %s ...', addr_id)
-        Address.query.filter(Address.id == addr_id).update(data)
+        data = dict(data, version=Address.version + 1)
+        Address.query.filter(Address.id == addr_id).update(data, synchronize_session=False)
         db.session.commit()
 
     @classmethod
@@ -355,6 +1091,5 @@ class Address(db.Model):
         """
         Remove all Addresses from the database
         """
-        for address in cls.query.all():
-            db.session.delete(address)
-        db.session.commit()
+        logger.info('Removing all Addresses')
+        truncate(cls)
@@ -0,0 +1,88 @@
+# Copyright 2016, 2021 John J. Rofrano. All Rights Reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+# https://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+### -----------------------------------------------------------
+###  Modified by DevOps Course Summer 2021 Customer Team
+###  Members:
+###     Du, Li | ld2342@nyu.edu | Nanjing | GMT+8
+###     Cai, Shuhong | sc8540@nyu.edu | Shanghai | GMT+8
+###     Zhang, Teng | tz2179@nyu.edu | Ningbo | GMT+8
+###     Zhang, Ken | sz1851@nyu.edu | Shanghai | GMT+8
+###     Wang,Yu-Hsing | yw5629@nyu.edu | Taiwan | GMT+8
+### -----------------------------------------------------------
+
+"""
+Profiling of single requests
+
+ProfilerMiddleware runs cProfile for the requests that carry the profiling
+header and saves the stats as {directory}/{request id}.prof, which can be read
+with pstats or drawn as a flame graph (e.g. with snakeviz). Requests without
+the header are passed straight through.
+"""
+
+import os
+import re
+import uuid
+import logging
+import cProfile
+
+logger = logging.getLogger("flask.app")
+
+REQUEST_ID = re.compile(r"^[A-Za-z0-9_-]{1,64}$")
+
+
+class ProfilerMiddleware:
+    """
+    WSGI middleware that profiles the requests which ask for it
+
+    The request ID is taken from X-Request-ID when it is a safe file name,
+    otherwise one is generated. It is returned in the X-Profile-Id header.
+    The response body is produced inside the profile, so a profiled response
+    is not streamed.
+    """
+
+    def __init__(self, app, directory, header="X-Profile"):
+        self.app = app
+        self.directory = directory
+        self.environ_key = "HTTP_" + header.upper().replace("-", "_")
+        os.makedirs(directory, exist_ok=True)
+
+    def __call__(self, environ, start_response):
+        if environ.get(self.environ_key, "").lower() not in ("1", "true", "yes"):
+            return self.app(environ, start_response)
+
+        request_id = environ.get("HTTP_X_REQUEST_ID", "")
+        if not REQUEST_ID.match(request_id):
+            request_id = uuid.uuid4().hex
+
+        def start_profiled_response(status, headers, exc_info=None):
+            headers.append(("X-Profile-Id", request_id))
+            return start_response(status, headers, exc_info)
+
+        def run():
+            app_iter = self.app(environ, start_profiled_response)
+            try:
+                return list(app_iter)
+            finally:
+                if hasattr(app_iter, "close"):
+                    app_iter.close()
+
+        profile = cProfile.Profile()
+        try:
+            return profile.runcall(run)
+        finally:
+            path = os.path.join(self.directory, request_id + ".prof")
+            profile.dump_stats(path)
+            logger.info("Profile of %s %s saved to %s", environ.get("REQUEST_METHOD"),
+                        environ.get("PATH_INFO"), path)
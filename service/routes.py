@@ -27,17 +27,37 @@ Customer Service
 
 Paths:
 ------
-GET /customers - Return a list of all Customers
+GET /customers - Return a list of all Customers (optionally one page at a time)
+GET /customers?fields=customer_id,user_id - Return only some fields of the Customers
+GET /customers?ids=1,2,3 - Return the Customers with the given IDs in that order
+POST /customers/batch - Return the Customers with the posted IDs in that order
+GET /customers/export - Stream all Customers as newline-delimited JSON
 GET /customers/{id} - Return the Customer with a given ID number
 POST /customers - Create a new Customer record in the database
+POST /customers/bulk - Create many Customer records in one transaction
 PUT /customers/{id} - Update a Customer record in the database
+PATCH /customers/{id} - Update some fields of a Customer with a JSON Merge Patch
+PUT /customers/activate - Activate many Customers picked by ID or by filters
+PUT /customers/deactivate - Deactivate many Customers picked by ID or by filters
 DELETE /customers/{id} - Deletes a Customer record in the database
+DELETE /customers - Deletes all Customers (or only the deactivated ones)
 """
 
 import uuid
-from flask import request, make_response
-from flask_restx import Api, Resource, fields, reqparse
-from service.models import Customer, Address, DataValidationError#, DatabaseConnectionError
+import json
+import operator
+import functools
+import collections
+import base64
+import hashlib
+import binascii
+from flask import request, make_response, stream_with_context, Response, jsonify
+from flask_restx import Api, Model, Resource, fields, reqparse, inputs
+from werkzeug.http import quote_etag
+import orjson
+from service.models import Customer, Address, DataValidationError, DataConflictError, \
+    pool_stats, read_replica, CUSTOMER_ROW_COLUMNS, ADDRESS_ROW_COLUMNS
+from service.cache import create_cache
 from . import status  # HTTP Status Codes
 
 # Import Flask application
@@ -53,6 +73,21 @@ def index():
     """
     return app.send_static_file("index.html")
 
+### -----------------------------------------------------------
+### Cache of serialized Customers keyed by customer_id
+### -----------------------------------------------------------
+customer_cache = create_cache(app.config['CACHE_BACKEND'],
+                              maxsize=app.config['CACHE_MAXSIZE'],
+                              ttl=app.config['CACHE_TTL'],
+                              uri=app.config['CACHE_URI'])
+
+@app.route("/stats")
+def stats():
+    """
+    Internal statistics of the service
+    """
+    return jsonify(cache=customer_cache.stats(), pool=pool_stats()), status.HTTP_200_OK
+
 ### -----------------------------------------------------------
 ### Configure Swagger
 ### -----------------------------------------------------------
@@ -97,7 +132,47 @@ customer_model = api.inherit('CustomerModel', base_customer_model, {
     'address': fields.Nested(address_model, description='Address of the Customer')
 })
 
+bulk_result_model = api.model('BulkResult', {
+    'index': fields.Integer(description='Position of the Customer in the posted list'),
+    'status': fields.Integer(description='HTTP status code for this Customer'),
+    'customer_id': fields.Integer(description='The system-generated unique Customer ID'),
+    'error': fields.String(description='Why this Customer was rejected')
+})
+
+# Every field of a merge patch is optional; null removes nullable Address fields
+patch_address_model = api.model('AddressPatch', {
+    name: fields.String(description=field.description)
+    for name, field in create_address_model.items()
+})
+
+patch_customer_model = api.model('CustomerPatch', {
+    'first_name': fields.String(description='The first name of the Customer'),
+    'last_name': fields.String(description='The last name of the Customer'),
+    'user_id': fields.String(description='The unique User ID given by the Customer'),
+    'password': fields.String(description='Password'),
+    'active': fields.Boolean(description='Active status (cannot be changed here)'),
+    'address': fields.Nested(patch_address_model, description='Address of the Customer')
+})
+
+status_ids_model = api.model('CustomerIds', {
+    'customer_ids': fields.List(fields.Integer, description='IDs of the Customers')
+})
+
+status_result_model = api.model('StatusResult', {
+    'active': fields.Boolean(description='The new active status'),
+    'updated': fields.Integer(description='How many Customers changed status')
+})
+
+# query string for bulk deletes
+delete_args = reqparse.RequestParser()
+delete_args.add_argument('active', type=inputs.boolean, required=False, choices=(False,), \
+    location='args', help='Pass false to delete only the deactivated Customers')
+
 # query string
+SEARCH_FILTERS = ('first_name', 'last_name', 'active', 'user_id', 'city', 'state', 'zip_code')
+MAX_PAGE_SIZE = 1000
+MAX_BULK_SIZE = 1000
+EXPORT_BATCH_SIZE = 1000
 customer_args = reqparse.RequestParser()
 customer_args.add_argument('user_id', type=str, required=False, \
     location='args', help='List Customers by their User ID')
@@ -113,6 +188,29 @@ customer_args.add_argument('state', type=str, required=False, \
     location='args', help='List Customers by the state in their addresses')
 customer_args.add_argument('zip_code', type=str, required=False, \
     location='args', help='List Customers by zip code in their addresses')
+customer_args.add_argument('ids', type=str, required=False, \
+    location='args', help='Comma-separated IDs of the Customers to return, in this order')
+customer_args.add_argument('fields', type=str, required=False, \
+    location='args', help='Comma-separated fields to return, e.g. customer_id,address.city')
+customer_args.add_argument('limit', type=inputs.int_range(1, MAX_PAGE_SIZE), required=False, \
+    location='args', help='Maximum number of Customers to return in one page')
+customer_args.add_argument('cursor', type=str, required=False, \
+    location='args', help='Opaque cursor returned by the previous page')
+
+# query string for bulk status changes: the list filters without paging
+status_args = customer_args.copy()
+status_args.remove_argument('ids')
+status_args.remove_argument('fields')
+status_args.remove_argument('limit')
+status_args.remove_argument('cursor')
+
+
+def search_filters(args):
+    """Returns the search filters given in the parsed query string"""
+    filters = {name: args[name] for name in SEARCH_FILTERS if args.get(name)}
+    if 'active' in filters:
+        filters['active'] = filters['active'] in ["True", "true"]
+    return filters
 
 
 ### -----------------------------------------------------------
@@ -130,6 +228,298 @@ def request_validation_error(error):
     }, status.HTTP_400_BAD_REQUEST
 
 
+@api.errorhandler(DataConflictError)
+def request_conflict_error(error):
+    """ Handles updates that lost a race with another request """
+    message = str(error)
+    app.logger.warning(message)
+    return {
+        'status_code': status.HTTP_409_CONFLICT,
+        'error': 'Conflict',
+        'message': message
+    }, status.HTTP_409_CONFLICT
+
+
+### -----------------------------------------------------------
+### Build entity tags from row versions
+### -----------------------------------------------------------
+def make_etag(*tags):
+    """ Returns a strong entity tag for the given Customer version tags """
+    return hashlib.sha1(repr(tags).encode("utf-8")).hexdigest()
+
+### -----------------------------------------------------------
+### Serialize Customer rows without marshalling them
+### -----------------------------------------------------------
+def row_getter(indexes):
+    """ Returns a function that picks the values at these indexes of a row as a tuple """
+    if not indexes:
+        return lambda row: ()
+    if len(indexes) == 1:
+        index = indexes[0]
+        return lambda row: (row[index],)
+    return operator.itemgetter(*indexes)
+
+def compile_row_serializer(model, columns):
+    """
+    Returns a function that turns a row into the dict marshal(row, model) returns
+
+    columns names the values of the row in order, nested fields as
+    "address.id". The keys and row positions are worked out once from the
+    model, so each row only becomes a dict of its values.
+    """
+    position = {name: index for index, name in enumerate(columns)}
+
+    def compile_fields(model_, prefix):
+        keys = []
+        indexes = []
+        nested = []
+        for key, field in model_.resolved.items():
+            if isinstance(field, fields.Nested):
+                nested.append((key, compile_fields(field.nested, prefix + key + ".")))
+            else:
+                keys.append(key)
+                indexes.append(position[prefix + key])
+        values = row_getter(indexes)
+        if not nested:
+            return lambda row: dict(zip(keys, values(row)))
+
+        def serialize(row):
+            item = dict(zip(keys, values(row)))
+            for key, serialize_nested in nested:
+                item[key] = serialize_nested(row)
+            return item
+        return serialize
+
+    return compile_fields(model, "")
+
+ROW_COLUMNS = CUSTOMER_ROW_COLUMNS + tuple("address." + name for name in ADDRESS_ROW_COLUMNS)
+serialize_row = compile_row_serializer(customer_model, ROW_COLUMNS)
+row_version_tag = operator.itemgetter(*[
+    ROW_COLUMNS.index(name) for name in ("customer_id", "version", "address.id", "address.version")
+])
+
+### -----------------------------------------------------------
+### Sparse fieldsets: read and serialize only the requested fields
+### -----------------------------------------------------------
+RowLayout = collections.namedtuple(
+    'RowLayout', ('customer_columns', 'address_columns', 'serialize', 'version_tag'))
+
+SPARSE_FIELDS = frozenset(
+    [name for name in customer_model.resolved] +
+    ["address." + name for name in address_model.resolved]
+)
+
+def parse_fields(value):
+    """ Returns the sorted fields asked for by fields=, or None for every field """
+    requested = {name.strip() for name in (value or "").split(",") if name.strip()}
+    if not requested:
+        return None
+    unknown = requested - SPARSE_FIELDS
+    if unknown:
+        raise DataValidationError("Unknown fields: {}".format(", ".join(sorted(unknown))))
+    return tuple(sorted(requested))
+
+@functools.lru_cache(maxsize=128)
+def row_layout(requested=None):
+    """
+    Returns the columns to read and how to serialize and tag rows of a fieldset
+
+    The customer_id and version are always read for paging and ETags. The
+    Address is only read when one of its fields is requested ("address"
+    requests all of them).
+    """
+    if requested is None:
+        return RowLayout(CUSTOMER_ROW_COLUMNS, ADDRESS_ROW_COLUMNS, serialize_row,
+                         row_version_tag)
+    address_fields = {name: field for name, field in address_model.resolved.items()
+                      if "address" in requested or "address." + name in requested}
+    model = Model('SparseCustomer')
+    for name, field in customer_model.resolved.items():
+        if name == 'address' and address_fields:
+            model[name] = fields.Nested(Model('SparseAddress', address_fields))
+        elif name in requested and name != 'address':
+            model[name] = field
+    customer_columns = ("customer_id", "version") + tuple(
+        name for name in CUSTOMER_ROW_COLUMNS if name in model and name != "customer_id")
+    address_columns = ()
+    if address_fields:
+        address_columns = ("id", "version") + tuple(
+            name for name in ADDRESS_ROW_COLUMNS if name in address_fields and name != "id")
+    columns = customer_columns + tuple("address." + name for name in address_columns)
+    if address_columns:
+        version_tag = operator.itemgetter(0, 1, len(customer_columns), len(customer_columns) + 1)
+    else:
+        version_tag = operator.itemgetter(0, 1)
+    return RowLayout(customer_columns, address_columns,
+                     compile_row_serializer(model, columns), version_tag)
+
+def fieldset_tag(requested):
+    """ Returns what a fieldset adds to the ETag of a list (nothing for every field) """
+    return () if requested is None else (requested,)
+
+def rows_response(rows, etag, headers, serialize=serialize_row):
+    """ Returns the rows as a JSON list, or 304 if the client already has them """
+    if request.if_none_match.contains_weak(etag):
+        app.logger.info("Customer list not modified")
+        return Response(status=status.HTTP_304_NOT_MODIFIED, headers=headers)
+    body = orjson.dumps([serialize(row) for row in rows])
+    app.logger.info("Returning %d customers", len(rows))
+    return Response(body, status=status.HTTP_200_OK, headers=headers,
+                    mimetype='application/json')
+
+def unique_ids(customer_ids):
+    """ Returns the Customer IDs without repeats, refusing more than a page of them """
+    customer_ids = list(dict.fromkeys(customer_ids))
+    if len(customer_ids) > MAX_PAGE_SIZE:
+        raise DataValidationError("At most {} ids can be fetched at once".format(MAX_PAGE_SIZE))
+    return customer_ids
+
+def order_rows(rows, customer_ids, requested=None):
+    """ Returns the rows in the order of customer_ids with their ETag and headers """
+    found = {row[0]: row for row in rows}
+    rows = [found[customer_id] for customer_id in customer_ids if customer_id in found]
+    layout = row_layout(requested)
+    etag = make_etag(*fieldset_tag(requested), *[layout.version_tag(row) for row in rows])
+    headers = {'ETag': quote_etag(etag)}
+    missing = [customer_id for customer_id in customer_ids if customer_id not in found]
+    if missing:
+        headers['X-Missing-Ids'] = ",".join(str(customer_id) for customer_id in missing)
+    return rows, etag, headers
+
+def fetch_rows(customer_ids, filters, requested=None):
+    """ Returns the Customers with the given IDs in the order they were asked for """
+    customer_ids = unique_ids(customer_ids)
+    app.logger.info("Fetching %d customers filtered by %s", len(customer_ids), filters)
+    layout = row_layout(requested)
+    rows = []
+    if customer_ids:
+        rows, _ = Customer.search_rows(customer_ids=customer_ids,
+                                       customer_columns=layout.customer_columns,
+                                       address_columns=layout.address_columns, **filters)
+    rows, etag, headers = order_rows(rows, customer_ids, requested)
+    return rows_response(rows, etag, headers, layout.serialize)
+
+### -----------------------------------------------------------
+### Encode and decode pagination cursors
+### -----------------------------------------------------------
+def encode_cursor(customer_id):
+    """ Returns an opaque cursor pointing after the given Customer ID """
+    token = json.dumps({"after": customer_id}).encode("utf-8")
+    return base64.urlsafe_b64encode(token).decode("ascii").rstrip("=")
+
+def decode_cursor(cursor):
+    """ Returns the Customer ID an opaque cursor points after """
+    try:
+        token = base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4))
+        after = json.loads(token.decode("utf-8"))["after"]
+    except (binascii.Error, UnicodeDecodeError, ValueError, KeyError, TypeError) as error:
+        raise DataValidationError("Invalid cursor: {}".format(error))
+    if not isinstance(after, int):
+        raise DataValidationError("Invalid cursor: {}".format(cursor))
+    return after
+
+### -----------------------------------------------------------
+### Read lists of Customer IDs
+### -----------------------------------------------------------
+def parse_ids(value):
+    """ Returns the Customer IDs in a comma-separated list """
+    try:
+        return [int(item) for item in value.split(",") if item.strip()]
+    except ValueError:
+        raise DataValidationError("Invalid ids: {}".format(value))
+
+def payload_ids():
+    """ Returns the customer_ids posted in the body, or None if there are none """
+    payload = request.get_json() or {}
+    if not isinstance(payload, dict):
+        raise DataValidationError("Request body must be a JSON object")
+    customer_ids = payload.get('customer_ids')
+    if customer_ids is not None and (
+            not isinstance(customer_ids, list)
+            or not all(isinstance(customer_id, int) and not isinstance(customer_id, bool)
+                       for customer_id in customer_ids)):
+        raise DataValidationError("customer_ids must be a list of integers")
+    return customer_ids
+
+### -----------------------------------------------------------
+### Read a JSON Merge Patch (RFC 7396) of a Customer
+### -----------------------------------------------------------
+CUSTOMER_PATCH_FIELDS = ('first_name', 'last_name', 'user_id', 'password')
+ADDRESS_PATCH_FIELDS = ('street', 'apartment', 'city', 'state', 'zip_code')
+
+def merge_patch():
+    """ Returns the Customer changes, Address changes and active status of a patch """
+    patch = request.get_json()
+    if not isinstance(patch, dict):
+        raise DataValidationError("A merge patch must be a JSON object")
+    changes = {}
+    address_changes = {}
+    for name, value in patch.items():
+        if name in CUSTOMER_PATCH_FIELDS:
+            if not isinstance(value, str):
+                raise DataValidationError("Invalid Customer: {} must be a string".format(name))
+            changes[name] = value
+        elif name == 'active':
+            if not isinstance(value, bool):
+                raise DataValidationError("Invalid Customer: active must be a boolean")
+        elif name == 'address':
+            if not isinstance(value, dict):
+                raise DataValidationError("Invalid Customer: address must be an object")
+            for key, item in value.items():
+                if key not in ADDRESS_PATCH_FIELDS:
+                    raise DataValidationError("Invalid Customer: address.{} cannot be changed"
+                                              .format(key))
+                if item is not None and not isinstance(item, str):
+                    raise DataValidationError("Invalid Customer: address.{} must be a string"
+                                              .format(key))
+                address_changes[key] = item
+        else:
+            raise DataValidationError("Invalid Customer: {} cannot be changed".format(name))
+    return changes, address_changes, patch.get('active')
+
+### -----------------------------------------------------------
+### Read a list of Customers from a JSON array or NDJSON body
+### -----------------------------------------------------------
+def bulk_payload():
+    """ Returns the list of Customers posted to a bulk endpoint """
+    if request.mimetype == 'application/x-ndjson':
+        try:
+            items = [json.loads(line) for line in request.get_data(as_text=True).splitlines()
+                     if line.strip()]
+        except ValueError as error:
+            raise DataValidationError("Invalid NDJSON body: {}".format(error))
+    else:
+        items = request.get_json()
+    if not isinstance(items, list):
+        raise DataValidationError("Expected a list of Customers")
+    if len(items) > MAX_BULK_SIZE:
+        raise DataValidationError("At most {} Customers can be posted at once"
+                                  .format(MAX_BULK_SIZE))
+    return items
+
+def bulk_customer(item):
+    """ Returns the Customer and Address of one posted item, checking their types
+
+    A bulk insert does not coerce values the way a single INSERT does, so a
+    numeric user_id is stored as its text and any other non-string field or
+    non-boolean active status is rejected.
+    """
+    customer = Customer().deserialize(item)
+    address = Address().deserialize(item.get('address'))
+    if isinstance(customer.user_id, int) and not isinstance(customer.user_id, bool):
+        customer.user_id = str(customer.user_id)
+    for name in CUSTOMER_PATCH_FIELDS:
+        if not isinstance(getattr(customer, name), str):
+            raise DataValidationError("Invalid Customer: {} must be a string".format(name))
+    if not isinstance(customer.active, bool):
+        raise DataValidationError("Invalid Customer: active must be a boolean")
+    for name in ADDRESS_PATCH_FIELDS:
+        value = getattr(address, name)
+        if value is not None and not isinstance(value, str):
+            raise DataValidationError("Invalid Customer: address.{} must be a string"
+                                      .format(name))
+    return customer, address
+
 ### -----------------------------------------------------------
 ### Generate a random API key
 ### -----------------------------------------------------------
@@ -162,14 +552,9 @@ class CustomerCollection(Resource):
         customer = Customer()
         app.logger.debug('Payload = %s', api.payload)
         customer.deserialize(api.payload)
-        customer.save()
-        customer_id = customer.customer_id
         address = Address()
-        address.deserialize(api.payload['address'])
-        address.customer_id = customer_id
-        address.save()
-        customer.address_id = address.id
-        customer.save()
+        address.deserialize(api.payload.get('address'))
+        customer.create(address)
         message = customer.serialize()
         location_url = api.url_for(CustomerResource, \
             customer_id=customer.customer_id, _external=True)
@@ -181,50 +566,243 @@ class CustomerCollection(Resource):
     ### -----------------------------------------------------------
     @api.doc('list_customers')
     @api.expect(customer_args, validate=True)
-    @api.marshal_list_with(customer_model)
+    @api.response(200, 'Success', [customer_model])
+    @api.response(304, 'Customer list not modified')
+    @read_replica
     def get(self):
         """
         Return all of the Customers that satisfy query constraints
         """
         app.logger.info("Request for customer list")
-        customers = []
         args = customer_args.parse_args()
-        if args['first_name']:
-            app.logger.info('Filtering by first name: %s', args['first_name'])
-            customers = Customer.find_by_first_name(args['first_name'])
-        elif args['last_name']:
-            app.logger.info('Filtering by last name: %s', args['last_name'])
-            customers = Customer.find_by_last_name(args['last_name'])
-        elif args['active']:
-            app.logger.info('Filtering by active status: %s', args['active'])
-            active = args['active'] in ["True", "true"]
-            customers = Customer.find_by_active(active)
-        elif args['user_id']:
-            app.logger.info('Filtering by user id: %s', args['user_id'])
-            customers = Customer.find_by_user_id(args['user_id'])
-        else:
-            app.logger.info('Getting all customers')
-            customers = Customer.all()
-        results = [c.serialize() for c in customers]
-        app.logger.info("Returning %d customers", len(results))
-        return results, status.HTTP_200_OK
+        filters = search_filters(args)
+        requested = parse_fields(args['fields'])
+        if args['ids'] is not None:
+            if args['limit'] or args['cursor']:
+                raise DataValidationError("ids cannot be combined with limit or cursor")
+            return fetch_rows(parse_ids(args['ids']), filters, requested)
+        app.logger.info('Filtering by %s', filters)
+        after = decode_cursor(args['cursor']) if args['cursor'] else None
+        layout = row_layout(requested)
+        rows, has_more = Customer.search_rows(after, args['limit'],
+                                              customer_columns=layout.customer_columns,
+                                              address_columns=layout.address_columns, **filters)
+        etag = make_etag(*fieldset_tag(requested), has_more,
+                         *[layout.version_tag(row) for row in rows])
+        headers = {'ETag': quote_etag(etag)}
+        if has_more:
+            cursor = encode_cursor(rows[-1][0])
+            query = request.args.to_dict()
+            query['cursor'] = cursor
+            next_url = api.url_for(CustomerCollection, _external=True, **query)
+            headers['Link'] = '<{}>; rel="next"'.format(next_url)
+            headers['X-Next-Cursor'] = cursor
+        return rows_response(rows, etag, headers, layout.serialize)
 
     #------------------------------------------------------------------
     # DELETE ALL CUSTOMERS (for testing only)
     #------------------------------------------------------------------
     @api.doc('delete_all_customers')
+    @api.expect(delete_args, validate=True)
     @api.response(204, 'All Customers deleted')
     def delete(self):
         """
         Delete all Customers (for testing only)
+        Pass active=false to purge only the deactivated Customers
         """
-        app.logger.info('Request to Delete all customers...')
-        Address.remove_all()
-        Customer.remove_all()
-        app.logger.info("Removed all Customers and Addresses from the database")
+        args = delete_args.parse_args()
+        if args['active'] is None:
+            app.logger.info('Request to Delete all customers...')
+            Customer.remove_all()
+            app.logger.info("Removed all Customers and Addresses from the database")
+        else:
+            app.logger.info('Request to Delete customers with active status %s', args['active'])
+            count = Customer.remove_all(active=args['active'])
+            app.logger.info("Removed %d Customers and their Addresses", count)
+        customer_cache.clear()
 
         return '', status.HTTP_204_NO_CONTENT
 
+######################################################################
+# PATH /customers/bulk
+######################################################################
+@api.route('/customers/bulk')
+class CustomerBulk(Resource):
+    """
+    Handles creating many Customers at once
+    """
+    ### -----------------------------------------------------------
+    ### ADD MANY NEW CUSTOMERS
+    ### -----------------------------------------------------------
+    @api.doc('bulk_create_customers')
+    @api.expect([create_customer_model])
+    @api.response(400, 'None of the posted Customers were valid')
+    @api.response(201, 'Customers created successfully')
+    @api.marshal_list_with(bulk_result_model, code=201)
+    def post(self):
+        """
+        Creates many Customers
+        This endpoint accepts a JSON array (or NDJSON body) of Customers and
+        creates all the valid ones in a single transaction
+        """
+        app.logger.info("Request to bulk create customers")
+        items = bulk_payload()
+        parsed = []
+        for item in items:
+            try:
+                parsed.append(bulk_customer(item))
+            except DataValidationError as error:
+                parsed.append(error)
+        taken = Customer.find_user_ids([pair[0].user_id for pair in parsed
+                                        if isinstance(pair, tuple)])
+        results = []
+        customers = []
+        for index, pair in enumerate(parsed):
+            try:
+                if isinstance(pair, DataValidationError):
+                    raise pair
+                customer, address = pair
+                if customer.user_id in taken:
+                    raise DataValidationError("User ID already exists")
+            except DataValidationError as error:
+                results.append({'index': index, 'status': status.HTTP_400_BAD_REQUEST,
+                                'error': str(error)})
+                continue
+            taken.add(customer.user_id)
+            customers.append((customer, address))
+            results.append({'index': index, 'status': status.HTTP_201_CREATED})
+
+        customer_ids = iter(Customer.bulk_create(customers))
+        for result in results:
+            if result['status'] == status.HTTP_201_CREATED:
+                result['customer_id'] = next(customer_ids)
+        app.logger.info("Bulk created %d of %d customers", len(customers), len(items))
+        if not customers:
+            return results, status.HTTP_400_BAD_REQUEST
+        return results, status.HTTP_201_CREATED
+
+######################################################################
+# PATH /customers/batch
+######################################################################
+@api.route('/customers/batch')
+class CustomerBatch(Resource):
+    """
+    Handles fetching many Customers by ID at once
+    """
+    ### -----------------------------------------------------------
+    ### FETCH MANY CUSTOMERS
+    ### -----------------------------------------------------------
+    @api.doc('batch_get_customers')
+    @api.param('fields', 'Comma-separated fields to return, e.g. customer_id,address.city')
+    @api.expect(status_ids_model)
+    @api.response(200, 'Success', [customer_model])
+    @api.response(304, 'Customers not modified')
+    @api.response(400, 'The posted IDs were not valid')
+    @read_replica
+    def post(self):
+        """
+        Return the Customers with the posted IDs
+        Customers are returned in the order of customer_ids; the IDs that were
+        not found are listed in the X-Missing-Ids header
+        """
+        app.logger.info("Request for a batch of customers")
+        customer_ids = payload_ids()
+        if customer_ids is None:
+            raise DataValidationError("customer_ids is required")
+        return fetch_rows(customer_ids, {}, parse_fields(request.args.get('fields')))
+
+######################################################################
+# PATH /customers/export
+######################################################################
+@api.route('/customers/export')
+class CustomerExport(Resource):
+    """
+    Handles bulk export of all Customers
+    """
+    ### -----------------------------------------------------------
+    ### EXPORT ALL CUSTOMERS
+    ### -----------------------------------------------------------
+    @api.doc('export_customers')
+    @api.produces(['application/x-ndjson'])
+    @api.response(200, 'One Customer per line as newline-delimited JSON')
+    def get(self):
+        """
+        Export all Customers
+        This endpoint will stream every Customer as newline-delimited JSON
+        """
+        app.logger.info("Request to export all customers")
+
+        def generate():
+            count = 0
+            for customer in Customer.stream(EXPORT_BATCH_SIZE):
+                count += 1
+                yield json.dumps(customer.serialize()) + "\n"
+            app.logger.info("Exported %d customers", count)
+
+        return Response(stream_with_context(generate()),
+                        status=status.HTTP_200_OK,
+                        mimetype='application/x-ndjson')
+
+######################################################################
+# PATH /customers/activate and /customers/deactivate
+######################################################################
+def bulk_set_active(value):
+    """Changes the active status of the Customers picked by the request"""
+    args = status_args.parse_args()
+    filters = search_filters(args)
+    customer_ids = payload_ids()
+    if customer_ids is None and not filters:
+        abort(status.HTTP_400_BAD_REQUEST, "Pick the Customers by customer_ids or filters")
+    app.logger.info('Filtering by %s', filters)
+    count = Customer.bulk_set_active(value, customer_ids, **filters)
+    customer_cache.clear()
+    app.logger.info("Set active status of %d customers to %s", count, value)
+    return {'active': value, 'updated': count}, status.HTTP_200_OK
+
+
+@api.route('/customers/activate')
+class ActivateCollection(Resource):
+    """
+    Handles activating many Customers at once
+    """
+    ### -----------------------------------------------------------
+    ### ACTIVATE MANY CUSTOMERS
+    ### -----------------------------------------------------------
+    @api.doc('bulk_activate_customers')
+    @api.expect(status_args, status_ids_model, validate=False)
+    @api.response(400, 'No Customers were picked')
+    @api.marshal_with(status_result_model)
+    def put(self):
+        """
+        Activate many Customers
+        The Customers are picked by the customer_ids in the body, by the
+        list filters in the query string, or by both
+        """
+        app.logger.info("Request to bulk activate customers")
+        return bulk_set_active(True)
+
+
+@api.route('/customers/deactivate')
+class DeactivateCollection(Resource):
+    """
+    Handles deactivating many Customers at once
+    """
+    ### -----------------------------------------------------------
+    ### DEACTIVATE MANY CUSTOMERS
+    ### -----------------------------------------------------------
+    @api.doc('bulk_deactivate_customers')
+    @api.expect(status_args, status_ids_model, validate=False)
+    @api.response(400, 'No Customers were picked')
+    @api.marshal_with(status_result_model)
+    def put(self):
+        """
+        Deactivate many Customers
+        The Customers are picked by the customer_ids in the body, by the
+        list filters in the query string, or by both
+        """
+        app.logger.info("Request to bulk deactivate customers")
+        return bulk_set_active(False)
+
 ######################################################################
 # PATH /customers/{customer_id}
 ######################################################################
@@ -239,20 +817,38 @@ class CustomerResource(Resource):
     ### -----------------------------------------------------------
     @api.doc('get_customers')
     @api.response(404, 'Customer not found')
+    @api.response(304, 'Customer not modified')
     @api.marshal_with(customer_model)
     def get(self, customer_id):
         """
         Retrieve a Customer
         This endpoint will return a Customer based on its Customer ID
         """
+        # read from the primary: a lagging replica would fill the shared
+        # cache with a row older than the last write
         app.logger.info("Request for customer with id: %s", customer_id)
-        customer = Customer.find(customer_id)
-        if not customer:
-            abort(status.HTTP_404_NOT_FOUND,
-                  "Customer with id '{}' was not found.".format(customer_id))
+        entry = customer_cache.get(customer_id)
+        if entry is None:
+            # taken before the read, so a write that lands in between
+            # keeps this copy out of the cache
+            generation = customer_cache.generation(customer_id)
+            customer = Customer.find(customer_id)
+            if not customer:
+                abort(status.HTTP_404_NOT_FOUND,
+                      "Customer with id '{}' was not found.".format(customer_id))
+            etag = make_etag(customer.version_tag())
+            if request.if_none_match.contains_weak(etag):
+                app.logger.info("Customer %s not modified", customer_id)
+                return None, status.HTTP_304_NOT_MODIFIED, {'ETag': quote_etag(etag)}
+            entry = {'etag': etag, 'customer': customer.serialize()}
+            customer_cache.fill(customer_id, entry, generation)
 
-        app.logger.info("Returning customer: %s", customer.customer_id)
-        return customer.serialize(), status.HTTP_200_OK
+        headers = {'ETag': quote_etag(entry['etag'])}
+        if request.if_none_match.contains_weak(entry['etag']):
+            app.logger.info("Customer %s not modified", customer_id)
+            return None, status.HTTP_304_NOT_MODIFIED, headers
+        app.logger.info("Returning customer: %s", customer_id)
+        return entry['customer'], status.HTTP_200_OK, headers
 
     ## -----------------------------------------------------------
     ### DELETE A CUSTOMER
@@ -268,6 +864,7 @@ class CustomerResource(Resource):
         customer = Customer.find(customer_id)
         if customer:
             customer.delete()
+        customer_cache.delete(customer_id)
 
         app.logger.info("Customer with ID [%s] delete complete.", customer_id)
         return make_response("", status.HTTP_204_NO_CONTENT)
@@ -279,18 +876,24 @@ class CustomerResource(Resource):
     @api.doc('update_customers')
     @api.response(404, 'Customer not found')
     @api.response(400, 'The posted Customer data was not valid')
+    @api.response(409, 'The Customer was changed by another request')
+    @api.response(412, 'The Customer does not match If-Match')
     @api.expect(customer_model)
     @api.marshal_with(customer_model)
     def put(self, customer_id):
         """
         Update a customer
         This endpoint will update a Customer based the body that is posted
+        Send If-Match with the ETag of the last read to update optimistically
         """
         app.logger.info("Request to update customer with id: %s", customer_id)
         cust = Customer.find(customer_id)
         if not cust:
             abort(status.HTTP_404_NOT_FOUND,
                   "Customer with id '{}' was not found.".format(customer_id))
+        if request.if_match and not request.if_match.contains(make_etag(cust.version_tag())):
+            abort(status.HTTP_412_PRECONDITION_FAILED,
+                  "Customer with id '{}' has been modified.".format(customer_id))
         app.logger.debug('Payload = %s', api.payload)
         data = api.payload
 
@@ -306,9 +909,51 @@ class CustomerResource(Resource):
         cust.save()
 
         Address.update(cust.address_id, request.get_json()['address'])
+        customer_cache.delete(customer_id)
 
         app.logger.info("Customer with ID [%s] updated.", cust.customer_id)
-        return cust.serialize(), status.HTTP_200_OK
+        message = cust.serialize()
+        return message, status.HTTP_200_OK, {'ETag': quote_etag(make_etag(cust.version_tag()))}
+
+    ### -----------------------------------------------------------
+    ### UPDATE SOME FIELDS OF A CUSTOMER
+    ### -----------------------------------------------------------
+    @api.doc('patch_customers')
+    @api.response(404, 'Customer not found')
+    @api.response(400, 'The posted patch was not valid')
+    @api.response(409, 'The Customer was changed by another request')
+    @api.response(412, 'The Customer does not match If-Match')
+    @api.expect(patch_customer_model, validate=False)
+    @api.marshal_with(customer_model)
+    def patch(self, customer_id):
+        """
+        Update some fields of a customer
+        This endpoint applies a JSON Merge Patch: only the fields in the body
+        change, with one UPDATE per table in a single transaction
+        Send If-Match with the ETag of the last read to update optimistically
+        """
+        app.logger.info("Request to patch customer with id: %s", customer_id)
+        changes, address_changes, active = merge_patch()
+        versions = None
+        if request.if_match:
+            rows, _ = Customer.search_rows(customer_ids=[customer_id])
+            if not rows:
+                abort(status.HTTP_404_NOT_FOUND,
+                      "Customer with id '{}' was not found.".format(customer_id))
+            if not request.if_match.contains(make_etag(row_version_tag(rows[0]))):
+                abort(status.HTTP_412_PRECONDITION_FAILED,
+                      "Customer with id '{}' has been modified.".format(customer_id))
+            _, version, _, address_version = row_version_tag(rows[0])
+            versions = (version, address_version)
+        row = Customer.patch(customer_id, changes, address_changes, active, versions)
+        if row is None:
+            abort(status.HTTP_404_NOT_FOUND,
+                  "Customer with id '{}' was not found.".format(customer_id))
+        customer_cache.delete(customer_id)
+
+        app.logger.info("Customer with ID [%s] patched.", customer_id)
+        etag = make_etag(row_version_tag(row))
+        return serialize_row(row), status.HTTP_200_OK, {'ETag': quote_etag(etag)}
 
 
 ######################################################################
@@ -332,16 +977,15 @@ class ActivateResource(Resource):
         This endpoint will return a Customer based on its Customer ID
         """
         app.logger.info("Request to activate customer with id: %s", customer_id)
-        customer = Customer.find(customer_id, filter_activate=False)
-        if not customer:
+        row = Customer.set_active(customer_id, True)
+        if row is None:
             abort(status.HTTP_404_NOT_FOUND,
                   "Customer with id '{}' was not found.".format(customer_id))
-        customer.active = True
-        customer.customer_id = customer_id
-        customer.save()
+        customer_cache.delete(customer_id)
 
-        app.logger.info("Customer with ID [%s] activated.", customer.customer_id)
-        return customer.serialize(), status.HTTP_200_OK
+        app.logger.info("Customer with ID [%s] activated.", customer_id)
+        etag = make_etag(row_version_tag(row))
+        return serialize_row(row), status.HTTP_200_OK, {'ETag': quote_etag(etag)}
 
 
 ######################################################################
@@ -365,17 +1009,15 @@ class DeactivateResource(Resource):
         This endpoint will return a Customer based on its Customer ID
         """
         app.logger.info("Request to deactivate customer with id: %s", customer_id)
-
-        customer = Customer.find(customer_id, filter_activate=False)
-        if not customer:
+        row = Customer.set_active(customer_id, False)
+        if row is None:
             abort(status.HTTP_404_NOT_FOUND,
                   "Customer with id '{}' was not found.".format(customer_id))
-        customer.active = False
-        customer.customer_id = customer_id
-        customer.save()
+        customer_cache.delete(customer_id)
 
-        app.logger.info("Customer with ID [%s] deactivated.", customer.customer_id)
-        return customer.serialize(), status.HTTP_200_OK
+        app.logger.info("Customer with ID [%s] deactivated.", customer_id)
+        etag = make_etag(row_version_tag(row))
+        return serialize_row(row), status.HTTP_200_OK, {'ETag': quote_etag(etag)}
 
 
 ### -----------------------------------------------------------
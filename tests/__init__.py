@@ -21,3 +21,13 @@
 ###     Zhang, Ken | sz1851@nyu.edu | Shanghai | GMT+8
 ###     Wang,Yu-Hsing | yw5629@nyu.edu | Taiwan | GMT+8
 ### -----------------------------------------------------------
+
+"""
+Test cases for the Customer Service
+"""
+
+import os
+
+# Without a Redis server the service caches nothing; test the caching with
+# an in-memory Redis shared by every test module
+os.environ.setdefault("CACHE_BACKEND", "fakeredis")
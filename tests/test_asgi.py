@@ -0,0 +1,248 @@
+# Copyright 2016, 2021 John J. Rofrano. All Rights Reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+# https://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+### -----------------------------------------------------------
+###  Modified by DevOps Course Summer 2021 Customer Team
+###  Members:
+###     Du, Li | ld2342@nyu.edu | Nanjing | GMT+8
+###     Cai, Shuhong | sc8540@nyu.edu | Shanghai | GMT+8
+###     Zhang, Teng | tz2179@nyu.edu | Ningbo | GMT+8
+###     Zhang, Ken | sz1851@nyu.edu | Shanghai | GMT+8
+###     Wang,Yu-Hsing | yw5629@nyu.edu | Taiwan | GMT+8
+### -----------------------------------------------------------
+
+"""
+Test cases for the Async Customer Service
+Test cases can be run with:
+  nosetests
+  coverage report -m
+"""
+
+import logging
+import unittest
+from flask_api import status    # HTTP Status Codes
+from starlette.testclient import TestClient
+from tests.factory_test import CustomerFactory, AddressFactory
+from service.models import Customer, db
+from service.routes import app as flask_app, customer_cache
+from service.asgi import app
+
+BASE_URL = "/api/customers"
+
+
+### -----------------------------------------------------------
+### TESTCASE MODULE for the Async Customer Server
+### -----------------------------------------------------------
+class TestAsyncCustomerServer(unittest.TestCase):
+    """Test Cases for the Async Customer Server"""
+    @classmethod
+    def setUpClass(cls):
+        """This runs once before the entire test suite"""
+        flask_app.config["TESTING"] = True
+        flask_app.logger.setLevel(logging.CRITICAL)
+        Customer.init_db(flask_app)
+
+    def setUp(self):
+        """This runs before each test"""
+        db.drop_all()  # clean up the last tests
+        db.create_all()  # make our sqlalchemy tables
+        db.session.remove()
+        customer_cache.clear()
+        self.client = TestClient(app)
+        self.client.__enter__()
+
+    def tearDown(self):
+        """This runs after each test"""
+        self.client.__exit__(None, None, None)
+        db.session.remove()
+        db.drop_all()
+
+    def _fake_customers(self, num, active=True):
+        """Factory method to fake customers in batch"""
+        customers = []
+        for _ in range(num):
+            test_customer = CustomerFactory()
+            test_customer.active = active
+            body = test_customer.alternative_serialize()
+            body["address"] = AddressFactory().serialize()
+            resp = self.client.post(BASE_URL, json=body)
+            self.assertEqual(resp.status_code, status.HTTP_201_CREATED, 'Could not create Customer')
+            customers.append(resp.json())
+        return customers
+
+    ### -----------------------------------------------------------
+    ### Testcases:
+    ### -----------------------------------------------------------
+    def test_create_customer(self):
+        """ Create new Customer on the Async Server """
+        customer = self._fake_customers(1)[0]
+        self.assertIsNotNone(customer["customer_id"])
+        self.assertIsNotNone(customer["address"]["id"])
+        resp = self.client.get("{}/{}".format(BASE_URL, customer["customer_id"]))
+        self.assertEqual(resp.status_code, status.HTTP_200_OK)
+        self.assertEqual(resp.json(), customer)
+        self.assertIn("ETag", resp.headers)
+
+    def test_create_customer_matches_flask(self):
+        """ The Async Server stores and returns Customers like the Flask one """
+        customer = self._fake_customers(1)[0]
+        resp = flask_app.test_client().get("{}/{}".format(BASE_URL, customer["customer_id"]))
+        self.assertEqual(resp.status_code, status.HTTP_200_OK)
+        self.assertEqual(resp.get_json(), customer)
+
+    def test_create_customer_bad_data(self):
+        """ Create a Customer with missing data """
+        resp = self.client.post(BASE_URL, json={"first_name": "Young"})
+        self.assertEqual(resp.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertEqual(resp.json()["error"], "Bad Request")
+
+    def test_create_customer_duplicate_user_id(self):
+        """ Create a Customer with a User ID already taken """
+        customer = self._fake_customers(1)[0]
+        body = dict(customer, address=dict(customer["address"]))
+        resp = self.client.post(BASE_URL, json=body)
+        self.assertEqual(resp.status_code, status.HTTP_400_BAD_REQUEST)
+        resp = self.client.get(BASE_URL)
+        self.assertEqual(len(resp.json()), 1)
+
+    def test_get_customer_not_found(self):
+        """ Get a Customer that does not exist """
+        resp = self.client.get("{}/0".format(BASE_URL))
+        self.assertEqual(resp.status_code, status.HTTP_404_NOT_FOUND)
+
+    def test_get_customer_not_modified(self):
+        """ Get a Customer with a current If-None-Match """
+        customer = self._fake_customers(1)[0]
+        url = "{}/{}".format(BASE_URL, customer["customer_id"])
+        etag = self.client.get(url).headers["ETag"]
+        resp = self.client.get(url, headers={"If-None-Match": etag})
+        self.assertEqual(resp.status_code, status.HTTP_304_NOT_MODIFIED)
+
+    def test_list_customers(self):
+        """ List and filter Customers """
+        self._fake_customers(3)
+        self._fake_customers(2, active=False)
+        resp = self.client.get(BASE_URL)
+        self.assertEqual(resp.status_code, status.HTTP_200_OK)
+        self.assertEqual(len(resp.json()), 5)
+        resp = self.client.get(BASE_URL, params={"active": "false"})
+        self.assertEqual(len(resp.json()), 2)
+        city = resp.json()[0]["address"]["city"]
+        resp = self.client.get(BASE_URL, params={"city": city})
+        self.assertTrue(all(c["address"]["city"] == city for c in resp.json()))
+
+    def test_list_customers_paginated(self):
+        """ List Customers one page at a time """
+        customer_ids = [c["customer_id"] for c in self._fake_customers(5)]
+        resp = self.client.get(BASE_URL, params={"limit": 2})
+        self.assertEqual([c["customer_id"] for c in resp.json()], customer_ids[:2])
+        self.assertIn('rel="next"', resp.headers["Link"])
+        seen = [c["customer_id"] for c in resp.json()]
+        while "X-Next-Cursor" in resp.headers:
+            resp = self.client.get(BASE_URL, params={"limit": 2,
+                                                     "cursor": resp.headers["X-Next-Cursor"]})
+            seen.extend(c["customer_id"] for c in resp.json())
+        self.assertEqual(seen, customer_ids)
+        resp = self.client.get(BASE_URL, params={"limit": 0})
+        self.assertEqual(resp.status_code, status.HTTP_400_BAD_REQUEST)
+        resp = self.client.get(BASE_URL, params={"cursor": "nonsense"})
+        self.assertEqual(resp.status_code, status.HTTP_400_BAD_REQUEST)
+
+    def test_list_customers_by_ids_and_fields(self):
+        """ List Customers by ID and with sparse fields like the Flask service """
+        customer_ids = [c["customer_id"] for c in self._fake_customers(3)]
+        flask_client = flask_app.test_client()
+        for params in ({"ids": "{},0,{}".format(customer_ids[2], customer_ids[0])},
+                       {"fields": "first_name,address.city"},
+                       {"ids": str(customer_ids[1]), "fields": "address"}):
+            resp = self.client.get(BASE_URL, params=params)
+            self.assertEqual(resp.status_code, status.HTTP_200_OK)
+            expected = flask_client.get(BASE_URL, query_string=params)
+            self.assertEqual(resp.json(), expected.get_json())
+            self.assertEqual(resp.headers["ETag"], expected.headers["ETag"])
+            self.assertEqual(resp.headers.get("X-Missing-Ids"),
+                             expected.headers.get("X-Missing-Ids"))
+        resp = self.client.get(BASE_URL, params={"ids": "1", "limit": 1})
+        self.assertEqual(resp.status_code, status.HTTP_400_BAD_REQUEST)
+        resp = self.client.get(BASE_URL, params={"fields": "nonsense"})
+        self.assertEqual(resp.status_code, status.HTTP_400_BAD_REQUEST)
+
+    def test_get_customer_cached(self):
+        """ Get a Customer through the cache shared with the Flask service """
+        customer = self._fake_customers(1)[0]
+        url = "{}/{}".format(BASE_URL, customer["customer_id"])
+        resp = self.client.get(url)
+        entry = customer_cache.get(customer["customer_id"])
+        self.assertEqual(entry["customer"], customer)
+        self.assertEqual(resp.headers["ETag"], '"{}"'.format(entry["etag"]))
+        self.assertEqual(flask_app.test_client().get(url).headers["ETag"],
+                         resp.headers["ETag"])
+        self.client.put(url + "/deactivate")
+        self.assertIsNone(customer_cache.get(customer["customer_id"]))
+        self.assertFalse(self.client.get(url).json()["active"])
+
+    def test_other_routes_served_by_flask(self):
+        """ Pass the routes that are not async on to the Flask service """
+        customer = self._fake_customers(1)[0]
+        url = "{}/{}".format(BASE_URL, customer["customer_id"])
+        resp = self.client.patch(url, json={"first_name": "Patched"})
+        self.assertEqual(resp.status_code, status.HTTP_200_OK)
+        self.assertEqual(resp.json()["first_name"], "Patched")
+        self.assertEqual(self.client.get(url).json()["first_name"], "Patched")
+        resp = self.client.get(BASE_URL + "/export")
+        self.assertEqual(resp.status_code, status.HTTP_200_OK)
+        self.assertEqual(len(resp.text.splitlines()), 1)
+
+    def test_update_customer(self):
+        """ Update a Customer and its Address """
+        customer = self._fake_customers(1)[0]
+        url = "{}/{}".format(BASE_URL, customer["customer_id"])
+        etag = self.client.get(url).headers["ETag"]
+        customer["first_name"] = "Changed"
+        customer["address"]["city"] = "Boston"
+        resp = self.client.put(url, json=customer, headers={"If-Match": etag})
+        self.assertEqual(resp.status_code, status.HTTP_200_OK)
+        self.assertEqual(resp.json()["first_name"], "Changed")
+        self.assertEqual(resp.json()["address"]["city"], "Boston")
+        self.assertNotEqual(resp.headers["ETag"], etag)
+        resp = self.client.put(url, json=customer, headers={"If-Match": etag})
+        self.assertEqual(resp.status_code, status.HTTP_412_PRECONDITION_FAILED)
+        customer["active"] = False
+        resp = self.client.put(url, json=customer)
+        self.assertEqual(resp.status_code, status.HTTP_400_BAD_REQUEST)
+
+    def test_activate_and_deactivate_customer(self):
+        """ Deactivate and activate a Customer """
+        customer = self._fake_customers(1)[0]
+        url = "{}/{}".format(BASE_URL, customer["customer_id"])
+        resp = self.client.put(url + "/deactivate")
+        self.assertEqual(resp.status_code, status.HTTP_200_OK)
+        self.assertFalse(resp.json()["active"])
+        resp = self.client.put(url + "/activate")
+        self.assertTrue(resp.json()["active"])
+        self.assertEqual(resp.headers["ETag"], self.client.get(url).headers["ETag"])
+        resp = self.client.put("{}/0/activate".format(BASE_URL))
+        self.assertEqual(resp.status_code, status.HTTP_404_NOT_FOUND)
+
+    def test_delete_customers(self):
+        """ Delete one Customer, the deactivated ones and then all of them """
+        customers = self._fake_customers(3)
+        self._fake_customers(2, active=False)
+        resp = self.client.delete("{}/{}".format(BASE_URL, customers[0]["customer_id"]))
+        self.assertEqual(resp.status_code, status.HTTP_204_NO_CONTENT)
+        resp = self.client.delete(BASE_URL, params={"active": "false"})
+        self.assertEqual(resp.status_code, status.HTTP_204_NO_CONTENT)
+        self.assertEqual(len(self.client.get(BASE_URL).json()), 2)
+        self.client.delete(BASE_URL)
+        self.assertEqual(self.client.get(BASE_URL).json(), [])
@@ -0,0 +1,237 @@
+# Copyright 2016, 2021 John J. Rofrano. All Rights Reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+# https://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+### -----------------------------------------------------------
+###  Modified by DevOps Course Summer 2021 Customer Team
+###  Members:
+###     Du, Li | ld2342@nyu.edu | Nanjing | GMT+8
+###     Cai, Shuhong | sc8540@nyu.edu | Shanghai | GMT+8
+###     Zhang, Teng | tz2179@nyu.edu | Ningbo | GMT+8
+###     Zhang, Ken | sz1851@nyu.edu | Shanghai | GMT+8
+###     Wang,Yu-Hsing | yw5629@nyu.edu | Taiwan | GMT+8
+### -----------------------------------------------------------
+
+"""
+Test cases for the Customer caches
+Test cases can be run with:
+  nosetests
+  coverage report -m
+"""
+
+import unittest
+import fakeredis
+from redis.exceptions import ConnectionError as RedisConnectionError
+from service.cache import LRUCache, RedisCache, create_cache
+
+
+class FakeClock:
+    """A clock that only moves when told to"""
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self):
+        return self.now
+
+
+class BrokenRedis:
+    """A Redis client whose server is unreachable"""
+    def __getattr__(self, name):
+        def fail(*args, **kwargs):
+            raise RedisConnectionError("Connection refused")
+        return fail
+
+
+### -----------------------------------------------------------
+### TESTCASE MODULE for LRUCache
+### -----------------------------------------------------------
+class TestLRUCache(unittest.TestCase):
+    """Test Cases for LRUCache"""
+
+    def setUp(self):
+        """This runs before each test"""
+        self.clock = FakeClock()
+        self.cache = LRUCache(maxsize=2, ttl=10, clock=self.clock)
+
+    ### -----------------------------------------------------------
+    ### Testcases:
+    ### -----------------------------------------------------------
+    def test_get_and_set(self):
+        """
+        Cache a value and read it back
+        """
+        self.assertIsNone(self.cache.get(1))
+        self.cache.set(1, {"customer_id": 1})
+        self.assertEqual(self.cache.get(1), {"customer_id": 1})
+        stats = self.cache.stats()
+        self.assertEqual(stats["hits"], 1)
+        self.assertEqual(stats["misses"], 1)
+        self.assertEqual(stats["size"], 1)
+
+    def test_evict_least_recently_used(self):
+        """
+        Evict the least recently used value when full
+        """
+        self.cache.set(1, "one")
+        self.cache.set(2, "two")
+        self.cache.get(1)
+        self.cache.set(3, "three")
+        self.assertIsNone(self.cache.get(2))
+        self.assertEqual(self.cache.get(1), "one")
+        self.assertEqual(self.cache.get(3), "three")
+        self.assertEqual(self.cache.stats()["evictions"], 1)
+
+    def test_expire_after_ttl(self):
+        """
+        Forget values older than the TTL
+        """
+        self.cache.set(1, "one")
+        self.clock.now = 9.9
+        self.assertEqual(self.cache.get(1), "one")
+        self.clock.now = 10
+        self.assertIsNone(self.cache.get(1))
+        stats = self.cache.stats()
+        self.assertEqual(stats["expirations"], 1)
+        self.assertEqual(stats["size"], 0)
+
+    def test_delete_and_clear(self):
+        """
+        Invalidate one or all values
+        """
+        self.cache.set(1, "one")
+        self.cache.set(2, "two")
+        self.cache.delete(1)
+        self.cache.delete(3)
+        self.assertIsNone(self.cache.get(1))
+        self.assertEqual(self.cache.get(2), "two")
+        self.cache.clear()
+        self.assertIsNone(self.cache.get(2))
+
+    def test_disabled(self):
+        """
+        Cache nothing when maxsize is zero
+        """
+        cache = LRUCache(maxsize=0)
+        cache.set(1, "one")
+        self.assertIsNone(cache.get(1))
+
+    def test_fill_after_invalidation(self):
+        """
+        Keep a value read before an invalidation out of the cache
+        """
+        generation = self.cache.generation(1)
+        self.cache.delete(1)
+        self.assertFalse(self.cache.fill(1, "stale", generation))
+        self.assertIsNone(self.cache.get(1))
+        generation = self.cache.generation(1)
+        self.cache.clear()
+        self.assertFalse(self.cache.fill(1, "stale", generation))
+        self.assertIsNone(self.cache.get(1))
+        self.assertTrue(self.cache.fill(1, "one", self.cache.generation(1)))
+        self.assertEqual(self.cache.get(1), "one")
+
+
+### -----------------------------------------------------------
+### TESTCASE MODULE for RedisCache
+### -----------------------------------------------------------
+class TestRedisCache(unittest.TestCase):
+    """Test Cases for RedisCache"""
+
+    def setUp(self):
+        """This runs before each test"""
+        self.server = fakeredis.FakeServer()
+        self.client = fakeredis.FakeRedis(server=self.server)
+        self.cache = RedisCache(self.client, ttl=10)
+
+    ### -----------------------------------------------------------
+    ### Testcases:
+    ### -----------------------------------------------------------
+    def test_get_and_set(self):
+        """
+        Cache a document and read it back
+        """
+        self.assertIsNone(self.cache.get(1))
+        self.cache.set(1, {"customer_id": 1, "address": {"city": "NYC"}})
+        self.assertEqual(self.cache.get(1), {"customer_id": 1, "address": {"city": "NYC"}})
+        self.assertEqual(self.client.ttl("customer:1"), 10)
+        stats = self.cache.stats()
+        self.assertEqual(stats["hits"], 1)
+        self.assertEqual(stats["misses"], 1)
+
+    def test_shared_between_workers(self):
+        """
+        See the entries and invalidations of another worker
+        """
+        other = RedisCache(fakeredis.FakeRedis(server=self.server), ttl=10)
+        self.cache.set(1, "one")
+        self.assertEqual(other.get(1), "one")
+        other.delete(1)
+        self.assertIsNone(self.cache.get(1))
+
+    def test_fill_after_invalidation(self):
+        """
+        Keep a document read before another worker's invalidation out of the cache
+        """
+        other = RedisCache(fakeredis.FakeRedis(server=self.server), ttl=10)
+        generation = self.cache.generation(1)
+        other.delete(1)
+        self.assertFalse(self.cache.fill(1, "stale", generation))
+        self.assertIsNone(self.cache.get(1))
+        self.assertEqual(self.client.ttl("customer-generation:1"), 10)
+        generation = self.cache.generation(1)
+        other.clear()
+        self.assertFalse(self.cache.fill(1, "stale", generation))
+        self.assertIsNone(self.cache.get(1))
+        generation = self.cache.generation(1)
+        other.delete(2)
+        self.assertTrue(self.cache.fill(1, "one", generation))
+        self.assertEqual(other.get(1), "one")
+        self.assertEqual(self.client.ttl("customer:1"), 10)
+
+    def test_clear_only_own_prefix(self):
+        """
+        Forget every cached document but leave other keys alone
+        """
+        self.client.set("unrelated", "keep")
+        self.cache.set(1, "one")
+        self.cache.set(2, "two")
+        self.cache.clear()
+        self.assertIsNone(self.cache.get(1))
+        self.assertIsNone(self.cache.get(2))
+        self.assertEqual(self.client.get("unrelated"), b"keep")
+
+    def test_server_unreachable(self):
+        """
+        Miss instead of failing when the server is unreachable
+        """
+        cache = RedisCache(BrokenRedis())
+        cache.set(1, "one")
+        self.assertIsNone(cache.get(1))
+        generation = cache.generation(1)
+        self.assertFalse(cache.fill(1, "one", generation))
+        self.assertFalse(cache.fill(1, "one", [None, None]))
+        cache.delete(1)
+        cache.clear()
+        self.assertEqual(cache.stats()["errors"], 6)
+
+    def test_create_cache(self):
+        """
+        Create each cache backend by name
+        """
+        self.assertIsInstance(create_cache("local", maxsize=5), LRUCache)
+        cache = create_cache("none")
+        cache.set(1, {"customer_id": 1})
+        self.assertIsNone(cache.get(1))
+        self.assertIsInstance(create_cache("fakeredis"), RedisCache)
+        self.assertIsInstance(create_cache("redis", uri="redis://localhost:6379/0"), RedisCache)
+        self.assertRaises(ValueError, create_cache, "memcached")
@@ -0,0 +1,197 @@
+# Copyright 2016, 2021 John J. Rofrano. All Rights Reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+# https://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+### -----------------------------------------------------------
+###  Modified by DevOps Course Summer 2021 Customer Team
+###  Members:
+###     Du, Li | ld2342@nyu.edu | Nanjing | GMT+8
+###     Cai, Shuhong | sc8540@nyu.edu | Shanghai | GMT+8
+###     Zhang, Teng | tz2179@nyu.edu | Ningbo | GMT+8
+###     Zhang, Ken | sz1851@nyu.edu | Shanghai | GMT+8
+###     Wang,Yu-Hsing | yw5629@nyu.edu | Taiwan | GMT+8
+### -----------------------------------------------------------
+
+"""
+Test cases for the Prometheus metrics
+Test cases can be run with:
+  nosetests
+  coverage report -m
+"""
+
+import os
+import logging
+import tempfile
+import unittest
+from unittest import mock
+from flask_api import status    # HTTP Status Codes
+from prometheus_client import REGISTRY, multiprocess, values
+from tests.factory_test import CustomerFactory, AddressFactory
+from service.models import Customer, db, queries
+from service import metrics
+from service.routes import app, customer_cache
+
+BASE_URL = "/api/customers"
+
+
+def sample(name, **labels):
+    """Returns the current value of a sample, 0 if it was never recorded"""
+    return REGISTRY.get_sample_value(name, labels) or 0
+
+
+### -----------------------------------------------------------
+### TESTCASE MODULE for the Prometheus metrics
+### -----------------------------------------------------------
+class TestMetrics(unittest.TestCase):
+    """Test Cases for the Prometheus metrics"""
+    @classmethod
+    def setUpClass(cls):
+        """This runs once before the entire test suite"""
+        app.config["TESTING"] = True
+        app.logger.setLevel(logging.CRITICAL)
+        Customer.init_db(app)
+
+    def setUp(self):
+        """This runs before each test"""
+        db.drop_all()  # clean up the last tests
+        db.create_all()  # make our sqlalchemy tables
+        customer_cache.clear()
+        self.app = app.test_client()
+
+    def tearDown(self):
+        """This runs after each test"""
+        db.session.remove()
+        db.drop_all()
+
+    def _create_customer(self):
+        """Creates a Customer through the API and returns its ID"""
+        body = CustomerFactory().alternative_serialize()
+        body["address"] = AddressFactory().serialize()
+        resp = self.app.post(BASE_URL, json=body)
+        self.assertEqual(resp.status_code, status.HTTP_201_CREATED)
+        return resp.get_json()["customer_id"]
+
+    ### -----------------------------------------------------------
+    ### Testcases:
+    ### -----------------------------------------------------------
+    def test_requests_counted_per_resource(self):
+        """ Requests are counted per flask-restx Resource, method and status """
+        labels = dict(resource="CustomerResource", method="GET")
+        ok_before = sample("customer_http_requests_total", status="200", **labels)
+        missing_before = sample("customer_http_requests_total", status="404", **labels)
+        timed_before = sample("customer_http_request_duration_seconds_count", **labels)
+        customer_id = self._create_customer()
+        self.app.get("{}/{}".format(BASE_URL, customer_id))
+        self.app.get("{}/0".format(BASE_URL))
+        self.assertEqual(sample("customer_http_requests_total", status="200", **labels),
+                         ok_before + 1)
+        self.assertEqual(sample("customer_http_requests_total", status="404", **labels),
+                         missing_before + 1)
+        self.assertEqual(sample("customer_http_request_duration_seconds_count", **labels),
+                         timed_before + 2)
+        self.assertEqual(sample("customer_http_requests_in_progress", **labels), 0)
+
+    def test_activate_and_deactivate_resources(self):
+        """ Activate and Deactivate are reported as their own Resources """
+        customer_id = self._create_customer()
+        for resource, action in (("DeactivateResource", "deactivate"),
+                                 ("ActivateResource", "activate")):
+            labels = dict(resource=resource, method="PUT", status="200")
+            before = sample("customer_http_requests_total", **labels)
+            self.app.put("{}/{}/{}".format(BASE_URL, customer_id, action))
+            self.assertEqual(sample("customer_http_requests_total", **labels), before + 1)
+
+    def test_db_queries_per_request(self):
+        """ The SQL statements of each request are counted and timed """
+        self._create_customer()
+        labels = dict(resource="CustomerCollection", method="GET")
+        count_before = sample("customer_db_queries_per_request_count", **labels)
+        sum_before = sample("customer_db_queries_per_request_sum", **labels)
+        self.app.get(BASE_URL)
+        self.assertEqual(sample("customer_db_queries_per_request_count", **labels),
+                         count_before + 1)
+        self.assertEqual(sample("customer_db_queries_per_request_sum", **labels),
+                         sum_before + 1)
+        self.assertGreater(sample("customer_db_duration_seconds_per_request_sum", **labels), 0)
+
+    def test_metrics_endpoint(self):
+        """ GET /metrics exports the metrics in the Prometheus text format """
+        self._create_customer()
+        resp = self.app.get("/metrics")
+        self.assertEqual(resp.status_code, status.HTTP_200_OK)
+        self.assertTrue(resp.content_type.startswith("text/plain"))
+        body = resp.get_data(as_text=True)
+        self.assertIn('customer_http_requests_total{method="POST",'
+                      'resource="CustomerCollection",status="201"}', body)
+        self.assertIn("customer_http_request_duration_seconds_bucket", body)
+
+    def test_metrics_of_every_worker(self):
+        """ With PROMETHEUS_MULTIPROC_DIR set /metrics adds up the samples of every worker """
+        labels = ("CustomerResource", "GET", "200")
+        requests = 'customer_http_requests_total{{method="{1}",resource="{0}",status="{2}"}}' \
+            .format(*labels)
+        in_progress = 'customer_http_requests_in_progress{{method="{1}",resource="{0}"}}' \
+            .format(*labels)
+        with tempfile.TemporaryDirectory() as directory:
+            with mock.patch.dict(os.environ, {"PROMETHEUS_MULTIPROC_DIR": directory}):
+                for pid, count in ((101, 2), (102, 3)):
+                    # what a worker with this pid writes to its own files
+                    value_class = values.MultiProcessValue(lambda pid=pid: pid)
+                    value_class("counter", "customer_http_requests",
+                                "customer_http_requests_total", ("resource", "method", "status"),
+                                labels).inc(count)
+                    value_class("gauge", "customer_http_requests_in_progress",
+                                "customer_http_requests_in_progress", ("resource", "method"),
+                                labels[:2], multiprocess_mode="livesum").inc(1)
+                self.assertIsNot(metrics.registry(), REGISTRY)
+                body = self.app.get("/metrics").get_data(as_text=True)
+                self.assertIn(requests + " 5.0", body)
+                self.assertIn(in_progress + " 2.0", body)
+                # gunicorn.conf.py marks exited workers dead: their gauges drop out
+                multiprocess.mark_process_dead(102, directory)
+                body = self.app.get("/metrics").get_data(as_text=True)
+                self.assertIn(requests + " 5.0", body)
+                self.assertIn(in_progress + " 1.0", body)
+
+    def test_debug_headers(self):
+        """ In debug mode responses report the SQL statements of their request """
+        customer_id = self._create_customer()
+        customer_cache.clear()
+        url = "{}/{}".format(BASE_URL, customer_id)
+        resp = self.app.get(url)
+        self.assertNotIn("X-DB-Queries", resp.headers)
+        customer_cache.clear()
+        app.debug = True
+        try:
+            resp = self.app.get(url)
+        finally:
+            app.debug = False
+        self.assertEqual(resp.headers["X-DB-Queries"], "1")
+        self.assertRegex(resp.headers["Server-Timing"],
+                         r'^db;dur=[0-9.]+;desc="1 queries", total;dur=[0-9.]+$')
+
+    def test_slow_query_log(self):
+        """ Statements slower than the threshold are logged with their route """
+        customer_id = self._create_customer()
+        customer_cache.clear()
+        slow_seconds = queries.slow_seconds
+        queries.slow_seconds = 0
+        try:
+            with self.assertLogs("flask.app", level="WARNING") as logs:
+                self.app.get("{}/{}".format(BASE_URL, customer_id))
+        finally:
+            queries.slow_seconds = slow_seconds
+        messages = [message for message in logs.output if "Slow query" in message]
+        self.assertEqual(len(messages), 1)
+        self.assertIn("from GET /api/customers/<int:customer_id>: SELECT", messages[0])
+
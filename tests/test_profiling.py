@@ -0,0 +1,103 @@
+# Copyright 2016, 2021 John J. Rofrano. All Rights Reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+# https://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+### -----------------------------------------------------------
+###  Modified by DevOps Course Summer 2021 Customer Team
+###  Members:
+###     Du, Li | ld2342@nyu.edu | Nanjing | GMT+8
+###     Cai, Shuhong | sc8540@nyu.edu | Shanghai | GMT+8
+###     Zhang, Teng | tz2179@nyu.edu | Ningbo | GMT+8
+###     Zhang, Ken | sz1851@nyu.edu | Shanghai | GMT+8
+###     Wang,Yu-Hsing | yw5629@nyu.edu | Taiwan | GMT+8
+### -----------------------------------------------------------
+
+"""
+Test cases for profiling single requests
+Test cases can be run with:
+  nosetests
+  coverage report -m
+"""
+
+import os
+import pstats
+import shutil
+import logging
+import tempfile
+import unittest
+from flask_api import status    # HTTP Status Codes
+from service.models import Customer, db
+from service.profiling import ProfilerMiddleware
+from service.routes import app
+
+BASE_URL = "/api/customers"
+
+
+### -----------------------------------------------------------
+### TESTCASE MODULE for the profiling middleware
+### -----------------------------------------------------------
+class TestProfilerMiddleware(unittest.TestCase):
+    """Test Cases for ProfilerMiddleware"""
+    @classmethod
+    def setUpClass(cls):
+        """This runs once before the entire test suite"""
+        app.config["TESTING"] = True
+        app.logger.setLevel(logging.CRITICAL)
+        Customer.init_db(app)
+
+    def setUp(self):
+        """This runs before each test"""
+        db.drop_all()  # clean up the last tests
+        db.create_all()  # make our sqlalchemy tables
+        self.directory = tempfile.mkdtemp()
+        self.wsgi_app = app.wsgi_app
+        app.wsgi_app = ProfilerMiddleware(app.wsgi_app, self.directory)
+        self.app = app.test_client()
+
+    def tearDown(self):
+        """This runs after each test"""
+        app.wsgi_app = self.wsgi_app
+        shutil.rmtree(self.directory)
+        db.session.remove()
+        db.drop_all()
+
+    ### -----------------------------------------------------------
+    ### Testcases:
+    ### -----------------------------------------------------------
+    def test_request_not_profiled(self):
+        """ Requests without the header are not profiled """
+        resp = self.app.get(BASE_URL)
+        self.assertEqual(resp.status_code, status.HTTP_200_OK)
+        self.assertNotIn("X-Profile-Id", resp.headers)
+        resp = self.app.get(BASE_URL, headers={"X-Profile": "0"})
+        self.assertNotIn("X-Profile-Id", resp.headers)
+        self.assertEqual(os.listdir(self.directory), [])
+
+    def test_request_profiled(self):
+        """ Requests with the header are profiled under their request ID """
+        resp = self.app.get(BASE_URL, headers={"X-Profile": "1", "X-Request-ID": "slow-list"})
+        self.assertEqual(resp.status_code, status.HTTP_200_OK)
+        self.assertEqual(resp.get_json(), [])
+        self.assertEqual(resp.headers["X-Profile-Id"], "slow-list")
+        path = os.path.join(self.directory, "slow-list.prof")
+        stats = pstats.Stats(path)
+        self.assertTrue(any(function == "get" and filename.endswith("routes.py")
+                            for filename, _, function in stats.stats))
+
+    def test_request_id_generated(self):
+        """ A request ID that is not a safe file name is replaced """
+        resp = self.app.get(BASE_URL, headers={"X-Profile": "true",
+                                               "X-Request-ID": "../../etc/passwd"})
+        profile_id = resp.headers["X-Profile-Id"]
+        self.assertRegex(profile_id, r"^[0-9a-f]{32}$")
+        self.assertEqual(os.listdir(self.directory), [profile_id + ".prof"])
@@ -29,13 +29,25 @@ Test cases can be run with:
   coverage report -m
 """
 
+import os
+import json
+import shutil
 import logging
+import tempfile
 import unittest
+from unittest import mock
 from urllib.parse import quote_plus
+from concurrent.futures import ThreadPoolExecutor
 from flask_api import status    # HTTP Status Codes
+from flask_restx import marshal
+import sqlalchemy
+from sqlalchemy import event
+import fakeredis
 from tests.factory_test import CustomerFactory, AddressFactory
-from service.models import Customer, db
-from service.routes import app
+from service.models import Customer, db, replicas
+from service.cache import RedisCache
+from service import routes
+from service.routes import app, customer_cache
 
 BASE_URL = "/api/customers"
 CONTENT_TYPE_JSON = "application/json"
@@ -62,6 +74,7 @@ class TestCustomerServer(unittest.TestCase):
         """This runs before each test"""
         db.drop_all()  # clean up the last tests
         db.create_all()  # make our sqlalchemy tables
+        customer_cache.clear()
         self.app = app.test_client()
 
     def tearDown(self):
@@ -69,6 +82,22 @@ class TestCustomerServer(unittest.TestCase):
         db.session.remove()
         db.drop_all()
 
+    def _count_queries(self, url):
+        """Issue a GET request and count the SELECT statements it runs"""
+        statements = []
+
+        def record(conn, cursor, statement, *args): # pylint: disable=unused-argument
+            if statement.lstrip().upper().startswith("SELECT"):
+                statements.append(statement)
+
+        event.listen(db.engine, "before_cursor_execute", record)
+        try:
+            resp = self.app.get(url)
+        finally:
+            event.remove(db.engine, "before_cursor_execute", record)
+        self.assertEqual(resp.status_code, status.HTTP_200_OK)
+        return len(statements)
+
     def _fake_customers(self, num, active=True):
         """Factory method to fake customers in batch"""
         customers = []
@@ -178,6 +207,106 @@ class TestCustomerServer(unittest.TestCase):
                              content_type=CONTENT_TYPE_JSON)
         self.assertEqual(resp.status_code, status.HTTP_400_BAD_REQUEST, "duplicate user ID not handled correctly")
 
+    def _fake_payloads(self, num):
+        """Factory method to fake Customer request bodies in batch"""
+        payloads = []
+        for index in range(num):
+            body = CustomerFactory().alternative_serialize()
+            body["user_id"] = "bulk-{}".format(index)
+            body["address"] = AddressFactory().serialize()
+            del body["address"]["id"]
+            payloads.append(body)
+        return payloads
+
+    def test_bulk_create_customers(self):
+        """
+        Create many Customers in one request
+        """
+        payloads = self._fake_payloads(4)
+        payloads[1] = {"first_name": "Missing", "user_id": "missing"}
+        payloads[3]["user_id"] = payloads[0]["user_id"]
+        resp = self.app.post(BASE_URL + "/bulk", json=payloads)
+        self.assertEqual(resp.status_code, status.HTTP_201_CREATED)
+        results = resp.get_json()
+        self.assertEqual([result["status"] for result in results], [201, 400, 201, 400])
+        self.assertIn("User ID already exists", results[3]["error"])
+        for index in (0, 2):
+            resp = self.app.get(BASE_URL + "/{}".format(results[index]["customer_id"]))
+            self.assertEqual(resp.status_code, status.HTTP_200_OK)
+            customer = resp.get_json()
+            self.assertEqual(customer["user_id"], payloads[index]["user_id"])
+            self.assertEqual(customer["address"]["city"], payloads[index]["address"]["city"])
+
+    def test_bulk_create_customers_bad_types(self):
+        """
+        <Anomaly> Reject only the bulk items whose fields have the wrong type
+        """
+        payloads = self._fake_payloads(5)
+        payloads[1]["user_id"] = 12345
+        payloads[2]["active"] = "maybe"
+        payloads[3]["first_name"] = {"x": 1}
+        payloads[4]["address"]["city"] = 7
+        resp = self.app.post(BASE_URL + "/bulk", json=payloads)
+        self.assertEqual(resp.status_code, status.HTTP_201_CREATED)
+        results = resp.get_json()
+        self.assertEqual([result["status"] for result in results], [201, 201, 400, 400, 400])
+        self.assertIn("active must be a boolean", results[2]["error"])
+        self.assertIn("first_name must be a string", results[3]["error"])
+        self.assertIn("address.city must be a string", results[4]["error"])
+        # a numeric user_id is stored as text, as a single POST does
+        resp = self.app.get(BASE_URL + "/{}".format(results[1]["customer_id"]))
+        self.assertEqual(resp.get_json()["user_id"], "12345")
+        # and is then taken for later posts, numeric or not
+        payloads = self._fake_payloads(2)
+        payloads[0]["user_id"] = 12345
+        payloads[1]["user_id"] = 777
+        resp = self.app.post(BASE_URL + "/bulk", json=payloads)
+        self.assertEqual([result["status"] for result in resp.get_json()], [400, 201])
+
+    def test_bulk_create_numeric_user_id(self):
+        """
+        Create a batch holding only a numeric User ID
+        """
+        payloads = self._fake_payloads(1)
+        payloads[0]["user_id"] = 777
+        resp = self.app.post(BASE_URL + "/bulk", json=payloads)
+        self.assertEqual(resp.status_code, status.HTTP_201_CREATED)
+        self.assertEqual(resp.get_json()[0]["status"], status.HTTP_201_CREATED)
+
+    def test_bulk_create_customers_ndjson(self):
+        """
+        Create many Customers from a newline-delimited JSON body
+        """
+        payloads = self._fake_payloads(3)
+        body = "\n".join(json.dumps(payload) for payload in payloads) + "\n"
+        resp = self.app.post(BASE_URL + "/bulk", data=body,
+                             content_type="application/x-ndjson")
+        self.assertEqual(resp.status_code, status.HTTP_201_CREATED)
+        self.assertEqual(len(resp.get_json()), 3)
+        resp = self.app.get(BASE_URL)
+        self.assertEqual(len(resp.get_json()), 3)
+
+    def test_bulk_create_existing_user_id(self):
+        """
+        <Anomaly> Create many Customers whose User IDs are all taken
+        """
+        customer = self._fake_customers(1)[0]
+        payloads = self._fake_payloads(1)
+        payloads[0]["user_id"] = customer.user_id
+        resp = self.app.post(BASE_URL + "/bulk", json=payloads)
+        self.assertEqual(resp.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertEqual(resp.get_json()[0]["status"], status.HTTP_400_BAD_REQUEST)
+
+    def test_bulk_create_not_a_list(self):
+        """
+        <Anomaly> Create many Customers without posting a list
+        """
+        resp = self.app.post(BASE_URL + "/bulk", json={"first_name": "Young"})
+        self.assertEqual(resp.status_code, status.HTTP_400_BAD_REQUEST)
+        resp = self.app.post(BASE_URL + "/bulk", data="{not json",
+                             content_type="application/x-ndjson")
+        self.assertEqual(resp.status_code, status.HTTP_400_BAD_REQUEST)
+
     def test_index(self):
         """
         Customer Server index call
@@ -206,6 +335,24 @@ class TestCustomerServer(unittest.TestCase):
                              content_type=CONTENT_TYPE_JSON)
         self.assertEqual(resp.status_code, status.HTTP_400_BAD_REQUEST)
 
+    def test_create_customer_missing_address(self):
+        """
+        <Anomaly> Create Customer with Address missing
+        """
+        body = {
+            "first_name": "Young",
+            "last_name": "Nick",
+            "user_id": "confused",
+            "password": "lakers",
+            "active": True
+        }
+        resp = self.app.post(BASE_URL,
+                             json=body,
+                             content_type=CONTENT_TYPE_JSON)
+        self.assertEqual(resp.status_code, status.HTTP_400_BAD_REQUEST)
+        resp = self.app.get(BASE_URL)
+        self.assertEqual(resp.get_json(), [])
+
     def test_create_customer_missing_street(self):
         """
         <Anomaly> Create Customer with Street missing
@@ -250,6 +397,283 @@ class TestCustomerServer(unittest.TestCase):
         data = resp.get_json()
         self.assertEqual(data["first_name"], test_customer.first_name)
 
+    def test_get_customer_from_cache(self):
+        """
+        Get a Customer twice without querying the database again
+        """
+        test_customer = self._fake_customers(1)[0]
+        url = BASE_URL + "/{}".format(test_customer.customer_id)
+        self.assertGreater(self._count_queries(url), 0)
+        self.assertEqual(self._count_queries(url), 0)
+        resp = self.app.get("/stats")
+        self.assertEqual(resp.status_code, status.HTTP_200_OK)
+        self.assertGreaterEqual(resp.get_json()["cache"]["hits"], 1)
+        self.assertIn("class", resp.get_json()["pool"])
+
+    def test_cache_invalidated_by_writes(self):
+        """
+        Get fresh Customers after deactivate, activate, update and delete
+        """
+        test_customer = self._fake_customers(1)[0]
+        url = BASE_URL + "/{}".format(test_customer.customer_id)
+        self.assertEqual(self.app.get(url).get_json()["active"], True)
+        self.app.put(url + "/deactivate")
+        self.assertEqual(self.app.get(url).get_json()["active"], False)
+        self.app.put(url + "/activate")
+        self.assertEqual(self.app.get(url).get_json()["active"], True)
+        body = self.app.get(url).get_json()
+        body["first_name"] = "Cached"
+        resp = self.app.put(url, json=body)
+        self.assertEqual(resp.status_code, status.HTTP_200_OK)
+        self.assertEqual(self.app.get(url).get_json()["first_name"], "Cached")
+        self.app.delete(url)
+        self.assertEqual(self.app.get(url).status_code, status.HTTP_404_NOT_FOUND)
+
+    def test_shared_cache_invalidated_by_writes(self):
+        """
+        Invalidate the cache shared with other workers on every write
+        """
+        server = fakeredis.FakeServer()
+        other_worker = RedisCache(fakeredis.FakeRedis(server=server))
+        routes.customer_cache = RedisCache(fakeredis.FakeRedis(server=server))
+        try:
+            test_customer = self._fake_customers(1)[0]
+            url = BASE_URL + "/{}".format(test_customer.customer_id)
+            self.app.get(url)
+            cached = other_worker.get(test_customer.customer_id)
+            self.assertEqual(cached["customer"]["active"], True)
+            self.app.put(url + "/deactivate")
+            self.assertIsNone(other_worker.get(test_customer.customer_id))
+            self.assertEqual(self.app.get(url).get_json()["active"], False)
+            cached = other_worker.get(test_customer.customer_id)
+            self.assertEqual(cached["customer"]["active"], False)
+        finally:
+            routes.customer_cache = customer_cache
+
+    def test_get_customer_not_modified(self):
+        """
+        Get a Customer conditionally with its ETag
+        """
+        test_customer = self._fake_customers(1)[0]
+        url = BASE_URL + "/{}".format(test_customer.customer_id)
+        resp = self.app.get(url)
+        etag = resp.headers["ETag"]
+        self.assertTrue(etag.startswith('"'))
+        resp = self.app.get(url, headers={"If-None-Match": etag})
+        self.assertEqual(resp.status_code, status.HTTP_304_NOT_MODIFIED)
+        self.assertEqual(resp.headers["ETag"], etag)
+        self.assertEqual(len(resp.data), 0)
+        # the ETag also matches when the Customer is not cached
+        customer_cache.clear()
+        resp = self.app.get(url, headers={"If-None-Match": etag})
+        self.assertEqual(resp.status_code, status.HTTP_304_NOT_MODIFIED)
+        # a changed Customer gets a new ETag
+        self.app.put(url + "/deactivate")
+        resp = self.app.get(url, headers={"If-None-Match": etag})
+        self.assertEqual(resp.status_code, status.HTTP_200_OK)
+        self.assertNotEqual(resp.headers["ETag"], etag)
+        self.assertEqual(resp.get_json()["active"], False)
+
+    def test_list_customers_not_modified(self):
+        """
+        List Customers conditionally with the list ETag
+        """
+        self._fake_customers(3)
+        resp = self.app.get(BASE_URL)
+        etag = resp.headers["ETag"]
+        resp = self.app.get(BASE_URL, headers={"If-None-Match": etag})
+        self.assertEqual(resp.status_code, status.HTTP_304_NOT_MODIFIED)
+        self.assertEqual(len(resp.data), 0)
+        self._fake_customers(1)
+        resp = self.app.get(BASE_URL, headers={"If-None-Match": etag})
+        self.assertEqual(resp.status_code, status.HTTP_200_OK)
+        self.assertEqual(len(resp.get_json()), 4)
+
+    def test_list_customers_matches_marshal(self):
+        """
+        List Customers exactly as marshalling them with customer_model would
+        """
+        self._fake_customers(2)
+        customer = CustomerFactory(address_id=None)
+        customer.save()
+        customers = Customer.query.order_by(Customer.customer_id).all()
+        expected = marshal([c.serialize() for c in customers], routes.customer_model)
+        resp = self.app.get(BASE_URL)
+        self.assertEqual(resp.status_code, status.HTTP_200_OK)
+        self.assertEqual(resp.content_type, CONTENT_TYPE_JSON)
+        self.assertEqual(resp.get_json(), json.loads(json.dumps(expected)))
+        etag = routes.make_etag(False, *[c.version_tag() for c in customers])
+        self.assertEqual(resp.headers["ETag"], '"{}"'.format(etag))
+
+    def test_list_customers_sparse_fields(self):
+        """
+        List only the requested fields of Customers
+        """
+        customers = self._fake_customers(3)
+        full = self.app.get(BASE_URL).get_json()
+        statements = []
+
+        def record(conn, cursor, statement, *args): # pylint: disable=unused-argument
+            statements.append(statement)
+
+        event.listen(db.engine, "before_cursor_execute", record)
+        try:
+            resp = self.app.get(BASE_URL, query_string={"fields": "customer_id,user_id"})
+        finally:
+            event.remove(db.engine, "before_cursor_execute", record)
+        self.assertEqual(resp.status_code, status.HTTP_200_OK)
+        self.assertEqual(resp.get_json(),
+                         [{"customer_id": c["customer_id"], "user_id": c["user_id"]} for c in full])
+        self.assertEqual(len(statements), 1)
+        self.assertNotIn("address", statements[0])
+        self.assertNotIn("password", statements[0])
+        # nested fields, address filters and paging
+        city = full[1]["address"]["city"]
+        resp = self.app.get(BASE_URL, query_string={"fields": "address.city, last_name",
+                                                    "city": city, "user_id": full[1]["user_id"]})
+        self.assertEqual(resp.get_json(), [{"last_name": full[1]["last_name"],
+                                            "address": {"city": city}}])
+        resp = self.app.get(BASE_URL, query_string={"fields": "customer_id", "limit": 2})
+        resp = self.app.get(resp.headers["Link"].split(">")[0].lstrip("<"))
+        self.assertEqual(resp.get_json(), [{"customer_id": full[2]["customer_id"]}])
+        resp = self.app.get(BASE_URL, query_string={"fields": "active", "city": city})
+        self.assertEqual(resp.get_json(), [{"active": True} for c in full
+                                           if c["address"]["city"] == city])
+        resp = self.app.get(BASE_URL, query_string={"fields": "address"})
+        self.assertEqual(resp.get_json(), [{"address": c["address"]} for c in full])
+        # a fieldset has its own ETag
+        resp = self.app.get(BASE_URL, query_string={"fields": "user_id"})
+        self.assertNotEqual(resp.headers["ETag"], self.app.get(BASE_URL).headers["ETag"])
+        resp = self.app.get(BASE_URL, query_string={"fields": "user_id"},
+                            headers={"If-None-Match": resp.headers["ETag"]})
+        self.assertEqual(resp.status_code, status.HTTP_304_NOT_MODIFIED)
+        # batches can be narrowed as well
+        resp = self.app.post(BASE_URL + "/batch?fields=user_id",
+                             json={"customer_ids": [customers[2].customer_id]})
+        self.assertEqual(resp.get_json(), [{"user_id": customers[2].user_id}])
+        resp = self.app.get(BASE_URL, query_string={"fields": "user_id,ssn"})
+        self.assertEqual(resp.status_code, status.HTTP_400_BAD_REQUEST)
+
+    def test_batch_get_customers(self):
+        """
+        Get many Customers by ID in the order they were asked for
+        """
+        customer_ids = [c.customer_id for c in self._fake_customers(3)]
+        missing = customer_ids[-1] + 100
+        wanted = [customer_ids[2], missing, customer_ids[0], customer_ids[2]]
+        query_count = self._count_queries(
+            BASE_URL + "?ids=" + ",".join(str(customer_id) for customer_id in wanted))
+        self.assertEqual(query_count, 1)
+        resp = self.app.get(BASE_URL, query_string={"ids": ",".join(map(str, wanted))})
+        self.assertEqual(resp.status_code, status.HTTP_200_OK)
+        self.assertEqual([c["customer_id"] for c in resp.get_json()],
+                         [customer_ids[2], customer_ids[0]])
+        self.assertEqual(resp.get_json()[1], self.app.get(
+            BASE_URL + "/{}".format(customer_ids[0])).get_json())
+        self.assertEqual(resp.headers["X-Missing-Ids"], str(missing))
+        # the same batch can be posted, and revalidated with its ETag
+        resp_post = self.app.post(BASE_URL + "/batch", json={"customer_ids": wanted})
+        self.assertEqual(resp_post.status_code, status.HTTP_200_OK)
+        self.assertEqual(resp_post.get_json(), resp.get_json())
+        self.assertEqual(resp_post.headers["X-Missing-Ids"], str(missing))
+        resp = self.app.post(BASE_URL + "/batch", json={"customer_ids": wanted},
+                             headers={"If-None-Match": resp.headers["ETag"]})
+        self.assertEqual(resp.status_code, status.HTTP_304_NOT_MODIFIED)
+        # filters still apply
+        self.app.put(BASE_URL + "/{}/deactivate".format(customer_ids[0]))
+        resp = self.app.get(BASE_URL, query_string={"ids": ",".join(map(str, customer_ids)),
+                                                    "active": "true"})
+        self.assertEqual([c["customer_id"] for c in resp.get_json()], customer_ids[1:])
+        self.assertEqual(resp.headers["X-Missing-Ids"], str(customer_ids[0]))
+
+    def test_batch_get_customers_bad_request(self):
+        """
+        Refuse batches with invalid or too many IDs
+        """
+        for query in ("ids=1,two", "ids=1&limit=5", "ids=" + ",".join(map(str, range(1001)))):
+            resp = self.app.get(BASE_URL + "?" + query)
+            self.assertEqual(resp.status_code, status.HTTP_400_BAD_REQUEST, query)
+        for body in ({}, {"customer_ids": "1,2"}, [1, 2]):
+            resp = self.app.post(BASE_URL + "/batch", json=body)
+            self.assertEqual(resp.status_code, status.HTTP_400_BAD_REQUEST, body)
+        resp = self.app.get(BASE_URL + "?ids=")
+        self.assertEqual(resp.get_json(), [])
+        self.assertNotIn("X-Missing-Ids", resp.headers)
+
+    def test_update_customer_if_match(self):
+        """
+        Update a Customer only if it still matches the ETag that was read
+        """
+        test_customer = self._fake_customers(1)[0]
+        url = BASE_URL + "/{}".format(test_customer.customer_id)
+        resp = self.app.get(url)
+        etag = resp.headers["ETag"]
+        body = resp.get_json()
+        body["first_name"] = "First"
+        resp = self.app.put(url, json=body, headers={"If-Match": etag})
+        self.assertEqual(resp.status_code, status.HTTP_200_OK)
+        new_etag = resp.headers["ETag"]
+        self.assertNotEqual(new_etag, etag)
+        self.assertEqual(self.app.get(url).headers["ETag"], new_etag)
+        # a second update based on the stale ETag is refused
+        body["first_name"] = "Second"
+        resp = self.app.put(url, json=body, headers={"If-Match": etag})
+        self.assertEqual(resp.status_code, status.HTTP_412_PRECONDITION_FAILED)
+        self.assertEqual(self.app.get(url).get_json()["first_name"], "First")
+
+    def _fake_replica(self, path):
+        """Create a replica database holding a single Customer"""
+        engine = sqlalchemy.create_engine("sqlite:///" + path)
+        db.Model.metadata.create_all(engine)
+        engine.execute(Customer.__table__.insert(), customer_id=1, first_name="Replica",
+                       last_name="Copy", user_id=path, password="secret", active=True)
+        engine.dispose()
+        return "sqlite:///" + path
+
+    def test_reads_from_replicas(self):
+        """
+        Read Customers from the replicas in turn and write to the primary
+        """
+        tmpdir = tempfile.mkdtemp()
+        uris = [self._fake_replica(os.path.join(tmpdir, name)) for name in ("r1.db", "r2.db")]
+        replicas.configure(uris, app.config)
+        try:
+            user_ids = set()
+            for _ in range(2):
+                db.session.remove()
+                data = self.app.get(BASE_URL).get_json()
+                self.assertEqual(len(data), 1)
+                self.assertEqual(data[0]["first_name"], "Replica")
+                user_ids.add(data[0]["user_id"])
+            self.assertEqual(len(user_ids), 2)
+            # writes still go to the primary
+            customer = self._fake_customers(1)[0]
+            self.assertEqual(Customer.query.count(), 1)
+            self.assertNotEqual(Customer.query.first().first_name, "Replica")
+            # a single Customer is read from the primary, so the cache never
+            # holds a row the replicas have not caught up with yet
+            db.session.remove()
+            resp = self.app.get("{}/{}".format(BASE_URL, customer.customer_id))
+            self.assertEqual(resp.status_code, status.HTTP_200_OK)
+            self.assertEqual(resp.get_json()["first_name"], customer.first_name)
+        finally:
+            replicas.configure([], app.config)
+            shutil.rmtree(tmpdir)
+
+    def test_failed_replica_falls_back_to_primary(self):
+        """
+        Read Customers from the primary when the replica is unreachable
+        """
+        self._fake_customers(2)
+        replicas.configure(["sqlite:////nonexistent/replica.db"], app.config)
+        try:
+            resp = self.app.get(BASE_URL)
+            self.assertEqual(resp.status_code, status.HTTP_200_OK)
+            self.assertEqual(len(resp.get_json()), 2)
+            self.assertIsNone(replicas.pick())
+        finally:
+            replicas.configure([], app.config)
+
     def test_list_all_customers(self):
         """
         List all Customers
@@ -260,6 +684,79 @@ class TestCustomerServer(unittest.TestCase):
         data = resp.get_json()
         self.assertEqual(len(data), 5)
 
+    def test_list_customers_query_count(self):
+        """
+        List Customers without a per-row Address lookup
+        """
+        self._fake_customers(1)
+        single = self._count_queries(BASE_URL)
+        self._fake_customers(9)
+        many = self._count_queries(BASE_URL)
+        self.assertLessEqual(single, 2)
+        self.assertEqual(many, single, "list endpoint issues queries per row")
+
+    def test_list_customers_in_pages(self):
+        """
+        List Customers one page at a time
+        """
+        customers = self._fake_customers(5)
+        seen = []
+        url = BASE_URL + "?limit=2"
+        pages = 0
+        while url:
+            resp = self.app.get(url)
+            self.assertEqual(resp.status_code, status.HTTP_200_OK)
+            data = resp.get_json()
+            self.assertLessEqual(len(data), 2)
+            seen.extend(customer["customer_id"] for customer in data)
+            pages += 1
+            link = resp.headers.get("Link")
+            url = link[link.index("<") + 1:link.index(">")] if link else None
+            if link:
+                self.assertIn(resp.headers["X-Next-Cursor"], link)
+        self.assertEqual(pages, 3)
+        self.assertEqual(seen, sorted(customer.customer_id for customer in customers))
+
+    def test_list_customers_page_keeps_filters(self):
+        """
+        List filtered Customers one page at a time
+        """
+        self._fake_customers(3, active=True)
+        self._fake_customers(2, active=False)
+        resp = self.app.get(BASE_URL, query_string="active=false&limit=1")
+        self.assertEqual(resp.status_code, status.HTTP_200_OK)
+        self.assertIn("active=false", resp.headers["Link"])
+        resp = self.app.get(BASE_URL, query_string={
+            "active": "false", "limit": 1, "cursor": resp.headers["X-Next-Cursor"]})
+        data = resp.get_json()
+        self.assertEqual(len(data), 1)
+        self.assertEqual(data[0]["active"], False)
+        self.assertIsNone(resp.headers.get("Link"))
+
+    def test_list_customers_bad_page(self):
+        """
+        <Anomaly> List Customers with an invalid limit or cursor
+        """
+        resp = self.app.get(BASE_URL, query_string="limit=0")
+        self.assertEqual(resp.status_code, status.HTTP_400_BAD_REQUEST)
+        resp = self.app.get(BASE_URL, query_string="cursor=not-a-cursor")
+        self.assertEqual(resp.status_code, status.HTTP_400_BAD_REQUEST)
+
+    def test_export_customers(self):
+        """
+        Export all Customers as newline-delimited JSON
+        """
+        customers = self._fake_customers(3)
+        resp = self.app.get(BASE_URL + "/export")
+        self.assertEqual(resp.status_code, status.HTTP_200_OK)
+        self.assertEqual(resp.mimetype, "application/x-ndjson")
+        lines = resp.get_data(as_text=True).splitlines()
+        self.assertEqual(len(lines), 3)
+        exported = [json.loads(line) for line in lines]
+        self.assertEqual([customer["customer_id"] for customer in exported],
+                         [customer.customer_id for customer in customers])
+        self.assertEqual(exported[0]["address"]["id"], customers[0].address_id)
+
     def test_query_customer_list_by_first_name(self):
         """
         Query Customers by First Name
@@ -330,6 +827,43 @@ class TestCustomerServer(unittest.TestCase):
         for customer in data:
             self.assertEqual(customer["user_id"], test_user_id)
 
+    def test_query_customer_list_by_address(self):
+        """
+        Query Customers by City, State and Zip Code
+        """
+        customers = self._fake_customers(10)
+        addresses = {customer["customer_id"]: customer["address"]
+                     for customer in self.app.get(BASE_URL).get_json()}
+        test_address = addresses[customers[0].customer_id]
+        for name in ("city", "state", "zip_code"):
+            matches = [customer_id for customer_id, address in addresses.items()
+                       if address[name] == test_address[name]]
+            resp = self.app.get(BASE_URL, query_string={name: test_address[name]})
+            self.assertEqual(resp.status_code, status.HTTP_200_OK)
+            data = resp.get_json()
+            self.assertEqual(sorted(customer["customer_id"] for customer in data), sorted(matches))
+            for customer in data:
+                self.assertEqual(customer["address"][name], test_address[name])
+
+    def test_query_customer_list_by_many_filters(self):
+        """
+        Query Customers by several filters at once
+        """
+        customers = self._fake_customers(6) + self._fake_customers(4, active=False)
+        addresses = {customer["customer_id"]: customer["address"]
+                     for customer in self.app.get(BASE_URL).get_json()}
+        test_customer = customers[-1]
+        test_city = addresses[test_customer.customer_id]["city"]
+        matches = [customer.customer_id for customer in customers
+                   if customer.last_name == test_customer.last_name
+                   and not customer.active
+                   and addresses[customer.customer_id]["city"] == test_city]
+        resp = self.app.get(BASE_URL, query_string={
+            "last_name": test_customer.last_name, "active": "false", "city": test_city})
+        self.assertEqual(resp.status_code, status.HTTP_200_OK)
+        data = resp.get_json()
+        self.assertEqual(sorted(customer["customer_id"] for customer in data), sorted(matches))
+
     def test_invalid_content_type(self):
         """
         <Anomaly> Create Customer with invalid content type
@@ -440,6 +974,102 @@ class TestCustomerServer(unittest.TestCase):
         )
         self.assertEqual(resp.status_code, status.HTTP_404_NOT_FOUND)
 
+    def test_deactivate_customer_single_statement(self):
+        """
+        Deactivate a customer with one UPDATE (plus a read back off PostgreSQL)
+        """
+        test_customer = self._fake_customers(1)[0]
+        url = BASE_URL + "/{}".format(test_customer.customer_id)
+        statements = []
+
+        def record(conn, cursor, statement, *args): # pylint: disable=unused-argument
+            statements.append(statement)
+
+        event.listen(db.engine, "before_cursor_execute", record)
+        try:
+            resp = self.app.put(url + "/deactivate")
+        finally:
+            event.remove(db.engine, "before_cursor_execute", record)
+        self.assertEqual(resp.status_code, status.HTTP_200_OK)
+        expected = 1 if db.engine.dialect.name == "postgresql" else 2
+        self.assertEqual(len(statements), expected)
+        self.assertIn("UPDATE customer", statements[0])
+        # the response matches what GET returns, ETag included
+        resp_get = self.app.get(url)
+        self.assertEqual(resp.get_json(), resp_get.get_json())
+        self.assertEqual(resp.headers["ETag"], resp_get.headers["ETag"])
+        self.assertEqual(resp.get_json()["address"]["id"], test_customer.address_id)
+
+    def test_toggle_customer_concurrently(self):
+        """
+        Activate and deactivate one customer from many threads at once
+        """
+        test_customer = self._fake_customers(1)[0]
+        version = Customer.find(test_customer.customer_id).version
+        url = BASE_URL + "/{}/".format(test_customer.customer_id)
+        toggles = 1000
+
+        def toggle(index):
+            active = index % 2 == 0
+            resp = app.test_client().put(url + ("activate" if active else "deactivate"))
+            return resp.status_code, resp.get_json()["active"] == active
+
+        with ThreadPoolExecutor(8) as executor:
+            results = list(executor.map(toggle, range(toggles)))
+        self.assertEqual(results, [(status.HTTP_200_OK, True)] * toggles)
+        # no toggle was lost: every one of them bumped the version
+        db.session.remove()
+        self.assertEqual(Customer.find(test_customer.customer_id).version, version + toggles)
+
+    def test_bulk_deactivate_customers(self):
+        """
+        Deactivate many customers by ID
+        """
+        customer_ids = [c.customer_id for c in self._fake_customers(4)]
+        url = BASE_URL + "/{}".format(customer_ids[0])
+        self.assertTrue(self.app.get(url).get_json()["active"])  # now cached
+        resp = self.app.put(BASE_URL + "/deactivate", json={"customer_ids": customer_ids[:3]})
+        self.assertEqual(resp.status_code, status.HTTP_200_OK)
+        self.assertEqual(resp.get_json(), {"active": False, "updated": 3})
+        self.assertFalse(self.app.get(url).get_json()["active"])
+        resp = self.app.get(BASE_URL, query_string="active=false")
+        self.assertEqual([c["customer_id"] for c in resp.get_json()], customer_ids[:3])
+        # customers that are already inactive are not counted again
+        resp = self.app.put(BASE_URL + "/deactivate", json={"customer_ids": customer_ids})
+        self.assertEqual(resp.get_json(), {"active": False, "updated": 1})
+
+    def test_bulk_activate_customers_by_filters(self):
+        """
+        Activate many customers picked by the list filters
+        """
+        inactive = self._fake_customers(3, active=False)
+        active = self._fake_customers(1)[0]
+        resp = self.app.put(BASE_URL + "/activate", query_string={"user_id": inactive[0].user_id})
+        self.assertEqual(resp.get_json(), {"active": True, "updated": 1})
+        resp = self.app.put(BASE_URL + "/activate", query_string="active=false",
+                            json={"customer_ids": [c.customer_id for c in inactive[1:]]})
+        self.assertEqual(resp.get_json(), {"active": True, "updated": 2})
+        resp = self.app.get(BASE_URL, query_string="active=true")
+        self.assertEqual(len(resp.get_json()), 4)
+        # address filters match the primary address
+        resp = self.app.get(BASE_URL + "/{}".format(active.customer_id))
+        city = resp.get_json()["address"]["city"]
+        resp = self.app.put(BASE_URL + "/deactivate", query_string={
+            "city": city, "user_id": active.user_id})
+        self.assertEqual(resp.get_json(), {"active": False, "updated": 1})
+        resp = self.app.put(BASE_URL + "/deactivate", query_string={
+            "city": city + "-nowhere", "user_id": inactive[0].user_id})
+        self.assertEqual(resp.get_json(), {"active": False, "updated": 0})
+
+    def test_bulk_set_active_bad_request(self):
+        """
+        Refuse bulk status changes that do not pick any customer
+        """
+        for body in (None, {}, {"customer_ids": "1,2"}, {"customer_ids": [1, "2"]},
+                     {"customer_ids": [True]}, [1, 2]):
+            resp = self.app.put(BASE_URL + "/deactivate", json=body)
+            self.assertEqual(resp.status_code, status.HTTP_400_BAD_REQUEST, body)
+
     def test_update_customer(self):
         """Update a customer"""
         customer = self._fake_customers(1)[0]
@@ -471,6 +1101,96 @@ class TestCustomerServer(unittest.TestCase):
         self.assertEqual(updated_customer['user_id'], "ztt", "user_id do not match")
         self.assertEqual(updated_customer['password'], "zttt", "password do not match")
 
+    def test_patch_customer(self):
+        """
+        Patch some fields of a customer with one UPDATE per table
+        """
+        test_customer = self._fake_customers(1)[0]
+        url = BASE_URL + "/{}".format(test_customer.customer_id)
+        before = self.app.get(url).get_json()  # now cached
+        statements = []
+
+        def record(conn, cursor, statement, *args): # pylint: disable=unused-argument
+            statements.append(statement.lstrip().split()[0].upper())
+
+        event.listen(db.engine, "before_cursor_execute", record)
+        try:
+            resp = self.app.patch(url, json={"first_name": "Ken", "active": True,
+                                             "address": {"city": "Ningbo", "apartment": None}},
+                                  content_type="application/merge-patch+json")
+        finally:
+            event.remove(db.engine, "before_cursor_execute", record)
+        self.assertEqual(resp.status_code, status.HTTP_200_OK)
+        self.assertEqual(statements, ["UPDATE", "UPDATE", "SELECT"])
+        expected = dict(before, first_name="Ken",
+                        address=dict(before["address"], city="Ningbo", apartment=None))
+        self.assertEqual(resp.get_json(), expected)
+        resp_get = self.app.get(url)
+        self.assertEqual(resp_get.get_json(), expected)
+        self.assertEqual(resp.headers["ETag"], resp_get.headers["ETag"])
+        # only the address changed: the customer row is left alone
+        resp = self.app.patch(url, json={"address": {"zip_code": "10001"}})
+        self.assertEqual(resp.get_json()["address"]["zip_code"], "10001")
+        self.assertEqual(resp.get_json()["first_name"], "Ken")
+        # an empty patch changes nothing
+        resp = self.app.patch(url, json={})
+        self.assertEqual(resp.status_code, status.HTTP_200_OK)
+        self.assertEqual(resp.headers["ETag"], self.app.get(url).headers["ETag"])
+
+    def test_patch_customer_if_match(self):
+        """
+        Patch a customer only while it matches If-Match
+        """
+        test_customer = self._fake_customers(1)[0]
+        url = BASE_URL + "/{}".format(test_customer.customer_id)
+        etag = self.app.get(url).headers["ETag"]
+        resp = self.app.patch(url, json={"last_name": "Du"}, headers={"If-Match": etag})
+        self.assertEqual(resp.status_code, status.HTTP_200_OK)
+        self.assertNotEqual(resp.headers["ETag"], etag)
+        resp = self.app.patch(url, json={"last_name": "Cai"}, headers={"If-Match": etag})
+        self.assertEqual(resp.status_code, status.HTTP_412_PRECONDITION_FAILED)
+        self.assertEqual(self.app.get(url).get_json()["last_name"], "Du")
+        # a change that lands between the If-Match check and the UPDATE is a conflict
+        resp = self.app.get(url)
+        etag, street = resp.headers["ETag"], resp.get_json()["address"]["street"]
+        original = Customer.patch
+
+        def racing_patch(*args, **kwargs):
+            original(test_customer.customer_id, {"password": "changed"})
+            return original(*args, **kwargs)
+
+        with mock.patch.object(Customer, "patch", side_effect=racing_patch):
+            resp = self.app.patch(url, json={"address": {"street": "Main St"}},
+                                  headers={"If-Match": etag})
+        self.assertEqual(resp.status_code, status.HTTP_409_CONFLICT)
+        customer_cache.clear()
+        resp = self.app.get(url)
+        self.assertEqual(resp.get_json()["address"]["street"], street)
+        self.assertEqual(resp.get_json()["password"], "changed")
+
+    def test_patch_customer_bad_request(self):
+        """
+        Refuse patches that are invalid or change the active status
+        """
+        test_customer = self._fake_customers(1)[0]
+        url = BASE_URL + "/{}".format(test_customer.customer_id)
+        before = self.app.get(url).get_json()
+        for patch in ([], {"active": False}, {"active": "yes"}, {"first_name": None},
+                      {"last_name": 5}, {"customer_id": 7}, {"address": None},
+                      {"address": {"id": 7}}, {"address": {"city": 5}},
+                      {"first_name": "Ken", "active": False},
+                      {"address": {"city": "Ningbo"}, "active": False}):
+            resp = self.app.patch(url, json=patch)
+            self.assertEqual(resp.status_code, status.HTTP_400_BAD_REQUEST, patch)
+        self.assertEqual(self.app.get(url).get_json(), before)
+        other = self._fake_customers(1)[0]
+        resp = self.app.patch(url, json={"user_id": other.user_id})
+        self.assertEqual(resp.status_code, status.HTTP_400_BAD_REQUEST)
+        resp = self.app.patch(BASE_URL + "/0", json={"first_name": "Ken"})
+        self.assertEqual(resp.status_code, status.HTTP_404_NOT_FOUND)
+        resp = self.app.patch(BASE_URL + "/0", json={})
+        self.assertEqual(resp.status_code, status.HTTP_404_NOT_FOUND)
+
     def test_update_customer_with_conflict_active_status(self):
         """Update a customer with conflict active status"""
         customer = self._fake_customers(1)[0]
@@ -549,6 +1269,25 @@ class TestCustomerServer(unittest.TestCase):
 
     def test_clear_database(self):
         """ Removes all Customers """
+        self._fake_customers(2)
         resp = self.app.delete('/api/customers', content_type=CONTENT_TYPE_JSON)
         self.assertEqual(resp.status_code, status.HTTP_204_NO_CONTENT)
         self.assertEqual(len(resp.data), 0)
+        resp = self.app.get(BASE_URL)
+        self.assertEqual(resp.get_json(), [])
+
+    def test_purge_deactivated_customers(self):
+        """ Removes only the deactivated Customers """
+        active = self._fake_customers(2)
+        self._fake_customers(3, active=False)
+        resp = self.app.delete(BASE_URL, query_string="active=false")
+        self.assertEqual(resp.status_code, status.HTTP_204_NO_CONTENT)
+        data = self.app.get(BASE_URL).get_json()
+        self.assertEqual(sorted(customer["customer_id"] for customer in data),
+                         sorted(customer.customer_id for customer in active))
+        resp = self.app.delete(BASE_URL, query_string="active=maybe")
+        self.assertEqual(resp.status_code, status.HTTP_400_BAD_REQUEST)
+        # active customers can only be removed all together with everyone else
+        resp = self.app.delete(BASE_URL, query_string="active=true")
+        self.assertEqual(resp.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertEqual(len(self.app.get(BASE_URL).get_json()), len(active))